@@ -0,0 +1,352 @@
+# Precomputed aggregates over the hourly air quality frame
+#
+# An AggregateCube holds count/sum/sum-of-squares/min/max of every
+# measurement column per cell of a key grid (e.g. station x year x month x
+# hour). Pages roll cells up to the grouping they plot instead of
+# re-grouping the full hourly frame on every rerun.
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Pollutant and meteorological columns of the cleaned dataset
+MEASUREMENT_COLUMNS = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3',
+                       'TEMP', 'PRES', 'DEWP', 'RAIN', 'WSPM']
+
+# Cube grids: hour-of-day profiles per month, and daily values
+HOURLY_KEYS = ['station', 'year', 'month', 'hour']
+DAILY_KEYS = ['station', 'year', 'month', 'day']
+
+# How each stored statistic combines when cells are rolled up
+_COMBINE = {'count': 'sum', 'sum': 'sum', 'sumsq': 'sum', 'min': 'min', 'max': 'max'}
+
+
+class AggregateCube:
+    def __init__(self, stats, rows, keys):
+        # stats: {'count'|'sum'|'sumsq'|'min'|'max': frame indexed by keys}
+        # rows: number of records per cell, including missing measurements
+        self.stats = stats
+        self.rows = rows
+        self.keys = keys
+        self._memo = {}
+
+    @classmethod
+    def build(cls, df, keys, columns=None):
+        if columns is None:
+            columns = [c for c in MEASUREMENT_COLUMNS if c in df.columns]
+        values = df[columns].astype('float64')
+        # Grouping by column names rather than Series avoids pandas' slow key lookup
+        def group(frame):
+            return pd.concat([df[keys], frame], axis=1).groupby(keys, observed=True, sort=True)
+        grouped = group(values)
+        stats = {
+            'count': grouped.count(),
+            'sum': grouped.sum(),
+            'sumsq': group(values ** 2).sum(),
+            'min': grouped.min(),
+            'max': grouped.max(),
+        }
+        return cls(stats, grouped.size(), keys)
+
+    # Pickled (persisted with the store) without the memoized rollups
+    def __getstate__(self):
+        return dict(self.__dict__, _memo={})
+
+    # Cube of disjoint cubes, e.g. one per station
+    @classmethod
+    def concat(cls, cubes):
+        keys = cubes[0].keys
+        stats = {name: pd.concat([cube.stats[name] for cube in cubes]).sort_index() for name in cubes[0].stats}
+        return cls(stats, pd.concat([cube.rows for cube in cubes]).sort_index(), keys)
+
+    # Cube holding the cells of both cubes, e.g. history plus a newly ingested batch
+    def merge(self, other):
+        stats = {name: pd.concat([frame, other.stats[name]]).groupby(level=self.keys, sort=True).agg(_COMBINE[name])
+                 for name, frame in self.stats.items()}
+        rows = pd.concat([self.rows, other.rows]).groupby(level=self.keys, sort=True).sum()
+        return AggregateCube(stats, rows, self.keys)
+
+    # Combine cells into the requested grouping, optionally filtered by key values
+    def rollup(self, by=(), **filters):
+        by = list(by)
+        memo_key = (tuple(by), tuple(sorted((k, tuple(np.atleast_1d(v))) for k, v in filters.items())))
+        if memo_key in self._memo:
+            return self._memo[memo_key]
+
+        mask = np.ones(len(self.rows), dtype=bool)
+        for key, value in filters.items():
+            mask &= self.rows.index.get_level_values(key).isin(np.atleast_1d(value))
+
+        rolled = {}
+        for name, frame in [('rows', self.rows)] + list(self.stats.items()):
+            frame = frame[mask]
+            how = _COMBINE.get(name, 'sum')
+            if by:
+                rolled[name] = frame.groupby(level=by, observed=True, sort=True).agg(how)
+            else:
+                rolled[name] = frame.agg(how)
+        self._memo[memo_key] = rolled
+        return rolled
+
+    def count(self, by=(), **filters):
+        return self.rollup(by, **filters)['rows']
+
+    def mean(self, column, by=(), **filters):
+        rolled = self.rollup(by, **filters)
+        return rolled['sum'][column] / rolled['count'][column]
+
+    # Sample standard deviation (ddof=1) from the sums of squares
+    def std(self, column, by=(), **filters):
+        rolled = self.rollup(by, **filters)
+        n = rolled['count'][column]
+        total = rolled['sum'][column]
+        variance = (rolled['sumsq'][column] - total ** 2 / n) / (n - 1)
+        return np.sqrt(np.maximum(variance, 0))
+
+    def min(self, column, by=(), **filters):
+        return self.rollup(by, **filters)['min'][column]
+
+    def max(self, column, by=(), **filters):
+        return self.rollup(by, **filters)['max'][column]
+
+    def values(self, key):
+        return sorted(self.rows.index.get_level_values(key).unique())
+
+
+# Rows where every given array has a value
+def _paired(*arrays):
+    arrays = [np.asarray(a, dtype='float64') for a in arrays]
+    valid = np.ones(len(arrays[0]), dtype=bool)
+    for a in arrays:
+        valid &= ~np.isnan(a)
+    return [a[valid] for a in arrays]
+
+
+# 2-D histogram of (x, y) pairs; returns counts[x_bin, y_bin] and the bin edges
+def density_grid(x, y, bins=80):
+    x, y = _paired(x, y)
+    return np.histogram2d(x, y, bins=bins)
+
+
+# Mergeable pairwise moments (n, means and co-moments) of a set of columns
+#
+# Missing values are handled pairwise, like DataFrame.corr(): entry [i, j]
+# only uses rows where both column i and column j have a value. Partitions
+# are combined with Chan et al.'s parallel update, so a correlation matrix
+# or OLS slope over any set of partitions costs O(partitions), not O(rows).
+class Moments:
+    def __init__(self, columns, n, mean, comoment, sqdev):
+        # n[i, j]: rows where columns i and j are both present
+        # mean[i, j]: mean of column i over those rows
+        # comoment[i, j]: sum of (x_i - mean[i, j]) * (x_j - mean[j, i]) over those rows
+        # sqdev[i, j]: sum of (x_i - mean[i, j]) ** 2 over those rows
+        self.columns = list(columns)
+        self.n = n
+        self.mean = mean
+        self.comoment = comoment
+        self.sqdev = sqdev
+
+    @classmethod
+    def empty(cls, columns):
+        k = len(columns)
+        return cls(columns, np.zeros((k, k)), np.zeros((k, k)), np.zeros((k, k)), np.zeros((k, k)))
+
+    @classmethod
+    def from_array(cls, columns, values):
+        values = np.asarray(values, dtype='float64')
+        valid = ~np.isnan(values)
+        counts = valid.sum(axis=0)
+        # Shift by the column means to keep the one-pass sums well conditioned
+        shift = np.where(counts > 0, np.nansum(values, axis=0) / np.maximum(counts, 1), 0)
+        x = np.where(valid, values - shift, 0)
+        v = valid.astype('float64')
+
+        n = v.T @ v
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sums = x.T @ v
+            mean = np.where(n > 0, sums / n, 0)
+            comoment = np.where(n > 0, x.T @ x - sums * sums.T / n, 0)
+            sqdev = np.where(n > 0, (x * x).T @ v - sums ** 2 / n, 0)
+        return cls(columns, n, mean + shift[:, None], comoment, sqdev)
+
+    def merge(self, other):
+        n = self.n + other.n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(n > 0, self.n * other.n / n, 0)
+            delta = other.mean - self.mean
+            mean = np.where(n > 0, self.mean + delta * other.n / n, 0)
+        return Moments(self.columns, n, mean,
+                       self.comoment + other.comoment + delta * delta.T * weight,
+                       self.sqdev + other.sqdev + delta ** 2 * weight)
+
+    def _index(self, columns):
+        return [self.columns.index(c) for c in columns]
+
+    # Pearson correlation matrix (pairwise complete), as returned by DataFrame.corr()
+    def correlation(self, columns=None):
+        columns = self.columns if columns is None else list(columns)
+        idx = self._index(columns)
+        comoment = self.comoment[np.ix_(idx, idx)]
+        sqdev = self.sqdev[np.ix_(idx, idx)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = comoment / np.sqrt(sqdev * sqdev.T)
+        np.fill_diagonal(corr, np.where(np.diag(sqdev) > 0, 1.0, np.nan))
+        return pd.DataFrame(corr, index=columns, columns=columns)
+
+    # OLS y = intercept + slope * x over rows where both are present
+    def linear_fit(self, x, y):
+        i, j = self._index([x, y])
+        slope = self.comoment[i, j] / self.sqdev[i, j]
+        return slope, self.mean[j, i] - slope * self.mean[i, j], int(self.n[i, j])
+
+
+def _moments_chunk(columns, blocks):
+    return [(key, Moments.from_array(columns, block)) for key, block in blocks]
+
+
+# Moments per partition (default station x year x month), optionally across processes
+def partition_moments(df, columns=None, keys=('station', 'year', 'month'), workers=None):
+    if columns is None:
+        columns = [c for c in MEASUREMENT_COLUMNS if c in df.columns]
+    values = df[columns].to_numpy(dtype='float64')
+    indices = df.groupby(list(keys), observed=True, sort=True).indices
+    blocks = [(key, values[rows]) for key, rows in indices.items()]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(blocks) < 2 * workers:
+        return dict(_moments_chunk(columns, blocks))
+    size = -(-len(blocks) // workers)
+    chunks = [blocks[i:i + size] for i in range(0, len(blocks), size)]
+    partitions = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_moments_chunk, [columns] * len(chunks), chunks):
+            partitions.update(result)
+    return partitions
+
+
+# Fold new per-partition accumulators (Moments or QuantileSketch) into existing ones
+def merge_partitions(partitions, new):
+    merged = dict(partitions)
+    for key, value in new.items():
+        merged[key] = merged[key].merge(value) if key in merged else value
+    return merged
+
+
+# Merge the partitions whose key matches the filters, e.g. station=['Dongsi']
+def merge_moments(partitions, keys=('station', 'year', 'month'), **filters):
+    columns = next(iter(partitions.values())).columns if partitions else []
+    allowed = {keys.index(k): set(np.atleast_1d(v)) for k, v in filters.items()}
+    total = Moments.empty(columns)
+    for key, moments in partitions.items():
+        if all(key[i] in values for i, values in allowed.items()):
+            total = total.merge(moments)
+    return total
+
+
+# Bin counts of a column on shared equal-width edges, overall or per group
+def binned_counts(df, column, by=None, bins=50):
+    values = df[column].to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    edges = np.histogram_bin_edges(values[valid], bins=bins)
+    index = np.clip(np.searchsorted(edges, values[valid], side='right') - 1, 0, bins - 1)
+    if by is None:
+        return edges, np.bincount(index, minlength=bins)
+    groups = df[by].astype('category')
+    codes = groups.cat.codes.to_numpy().astype('int64')[valid]
+    labels = groups.cat.categories
+    counts = np.bincount(codes * bins + index, minlength=len(labels) * bins).reshape(len(labels), bins)
+    return edges, {label: counts[i] for i, label in enumerate(labels) if counts[i].any()}
+
+
+# Mergeable quantile sketch with bounded relative error (DDSketch-style)
+#
+# Values are counted in logarithmic buckets of ratio gamma = (1 + a) / (1 - a),
+# so any quantile is returned within a relative error a of the true value.
+# Merging two sketches with the same accuracy adds their bucket counts.
+_KEY_OFFSET = 1 << 20
+
+
+class QuantileSketch:
+    def __init__(self, relative_accuracy, codes, counts, minimum, maximum):
+        # codes: sorted signed bucket codes (0 for zeros), ordered like the values
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.codes = codes
+        self.counts = counts
+        self.min = minimum
+        self.max = maximum
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    @staticmethod
+    def encode(values, relative_accuracy):
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        magnitude = np.abs(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            keys = np.ceil(np.log(magnitude) / np.log(gamma))
+            codes = np.sign(values) * (keys + _KEY_OFFSET)
+        return np.where(magnitude > 0, codes, 0).astype('int64')
+
+    def decode(self, codes):
+        keys = np.abs(codes) - _KEY_OFFSET
+        return np.sign(codes) * 2 * self.gamma ** keys / (self.gamma + 1)
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=0.01):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        codes, counts = np.unique(cls.encode(values, relative_accuracy), return_counts=True)
+        if len(values) == 0:
+            return cls(relative_accuracy, codes, counts, np.nan, np.nan)
+        return cls(relative_accuracy, codes, counts, values.min(), values.max())
+
+    def merge(self, other):
+        codes = np.concatenate([self.codes, other.codes])
+        counts = np.concatenate([self.counts, other.counts])
+        codes, inverse = np.unique(codes, return_inverse=True)
+        return QuantileSketch(self.relative_accuracy, codes, np.bincount(inverse, weights=counts).astype('int64'),
+                              np.fmin(self.min, other.min), np.fmax(self.max, other.max))
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype='float64')
+        if self.n == 0:
+            return np.full(q.shape, np.nan)
+        ranks = q * (self.n - 1)
+        position = np.searchsorted(np.cumsum(self.counts), ranks, side='right')
+        values = self.decode(self.codes[np.minimum(position, len(self.codes) - 1)])
+        return np.clip(values, self.min, self.max)
+
+    # Tukey box statistics; whiskers end at the most extreme bucket inside 1.5 IQR
+    def box_stats(self):
+        q1, median, q3 = self.quantile([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        values = np.clip(self.decode(self.codes), self.min, self.max)
+        inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+        return {'q1': q1, 'median': median, 'q3': q3,
+                'lowerfence': inside.min() if len(inside) else q1,
+                'upperfence': inside.max() if len(inside) else q3}
+
+
+# Quantile sketches of a column per group (default station x year)
+def quantile_sketches(df, column, keys=('station', 'year'), relative_accuracy=0.01):
+    values = df[column].to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    frame = pd.DataFrame({k: df[k].to_numpy()[valid] for k in keys})
+    frame['value'] = values[valid]
+    frame['code'] = QuantileSketch.encode(frame['value'].to_numpy(), relative_accuracy)
+
+    sizes = frame.groupby(list(keys) + ['code'], observed=True, sort=True).size()
+    extremes = frame.groupby(list(keys), observed=True, sort=True)['value'].agg(['min', 'max'])
+    group_ids = sizes.index.droplevel('code').factorize()[0]
+    bounds = np.r_[np.flatnonzero(np.r_[True, np.diff(group_ids) != 0]), len(sizes)]
+    codes = sizes.index.get_level_values('code').to_numpy()
+    counts = sizes.to_numpy()
+
+    sketches = {}
+    for i, (key, (low, high)) in enumerate(zip(extremes.index, extremes.to_numpy())):
+        start, stop = bounds[i], bounds[i + 1]
+        sketches[key] = QuantileSketch(relative_accuracy, codes[start:stop], counts[start:stop], low, high)
+    return sketches
@@ -1,13 +1,31 @@
+import os
+import threading
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import gdown
-import os
-from scipy import stats
-import plotly.express as px
-import plotly.graph_objects as go
+import analytics
+import artifacts
+import figures
+import precompute
+from data_store import ensure_store, file_lock
+from ingest import Dataset, DateRangeView
+from preprocessing import date_slice
+import instrumentation
+# The page computations live in analytics.py and the figures in figures.py, so
+# reports.py can render the same pages without Streamlit.
+# Heavier optional modules (fetch, statsmodels, decomposition, plotly.subplots)
+# are imported by the code paths that use them so the first page renders sooner
+
+# Sessions share cached frames (artifacts.py); with copy-on-write, the default from
+# pandas 3, modifying one copies it instead of changing what the other sessions see
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+# Opt-in instrumentation (DASHBOARD_PROFILE=1): stage timings, allocations, cache hits and
+# chart payloads in a sidebar panel. Disabled, these are the plain Streamlit functions.
+profile = instrumentation.start_run(st.session_state)
+cache_resource = instrumentation.cached(st.cache_resource)
+plotly_chart = instrumentation.chart(st.plotly_chart)
 
 # Title page
 st.set_page_config(page_title=" Air Quality Analysis by Geralda Livia")
@@ -39,46 +57,113 @@ This project aims to analyze air quality data from Dongsi and Wanliu stations in
 # ID GDrive
 file_id = "11MUFnACVg1Lxh05u7RRb7bEaK-RJTJYh"
 output = "data.csv"
+store = "data.store"
 url = f'https://drive.google.com/uc?id={file_id}'
-# Download data
-@st.cache_data
-def load_data():
-    # Download file
-    gdown.download(url, output, quiet=False)
-    data = pd.read_csv(output)
-    return data
+# The Drive file by default. DASHBOARD_DATA_SOURCE may name another URL, a local file or a
+# mirror directory holding data.csv (air-gapped deployments); DASHBOARD_DATA_SHA256 is the
+# digest the file must have.
+source = os.environ.get('DASHBOARD_DATA_SOURCE', url)
+expected_sha256 = os.environ.get('DASHBOARD_DATA_SHA256')
+# Download data when upstream has changed (see fetch.py), then query the store partitioned by
+# station and year, rebuilt only when the data changed.
+# The dataset is shared across sessions and picks up batches appended with ingest.py.
+# Only the aggregates are kept in memory; pages read the partitions and columns they plot.
+# The aggregates are built in this process (workers=1): forking a process pool from the
+# threaded server could copy locks held by other threads.
+@cache_resource
+def open_dataset():
+    from fetch import fetch
+    # One process fetches and builds the store; the others wait, then reuse them
+    with file_lock(f'{store}.lock'):
+        try:
+            digest = fetch(source, output, sha256=expected_sha256)
+        except OSError:
+            # Offline: keep using the data fetched earlier
+            if not (os.path.exists(output) or os.path.exists(store)):
+                raise
+            digest = None
+        ensure_store(output, store, source=digest)
+    return Dataset(store, workers=1, in_memory=False)
+# Seasonal decompositions are shared across sessions as well
+@cache_resource
+def open_decomposer():
+    from decomposition import Decomposer
+    return Decomposer(open_dataset())
 try:
-    data = load_data()
-    st.write(f"Success Load The Data {data.shape[0]} baris")
-    st.dataframe(data.head())
+    with profile.stage('load_data'):
+        dataset = open_dataset()
+    with profile.stage('preprocess_data'):
+        dataset.refresh()
+    data_head = dataset.head()
+    st.write(f"Success Load The Data {dataset.row_count} baris")
+    st.dataframe(data_head)
 except Exception as e:
     st.error(f"Error: {e}")
 # Display raw data sample
 with st.expander("Dataset Overview"):
-    st.dataframe(data.head())
-    st.write(f"Dataset shape: {data.shape}")
+    st.dataframe(data_head)
+    st.write(f"Dataset shape: {(dataset.row_count, data_head.shape[1])}")
 
-# Data preprocessing
-@st.cache_data
-def preprocess_data(df):
-    # Create datetime column
-    if 'date' not in df.columns:
-        df['date'] = pd.to_datetime(df[['year', 'month', 'day', 'hour']])
-    
-    # Extract time components
-    df['day_of_week'] = df['date'].dt.day_name()
-    df['hour_of_day'] = df['date'].dt.hour
-    df['month_name'] = df['date'].dt.month_name()
-    df['year_month'] = df['date'].dt.strftime('%Y-%m')
-    
-    # Filter for stations of interest
-    dongsi_data = df[df['station'] == 'Dongsi'].copy()
-    wanliu_data = df[df['station'] == 'Wanliu'].copy()
-    
-    return df, dongsi_data, wanliu_data
+# The dataset holds the aggregates, updated incrementally on refresh; hourly rows
+# (compact time columns, sorted by date) are read per query from the store.
+# Stations come from the data; each keeps one colour across every page
+stations = dataset.stations
+station_colors = figures.station_colors(stations)
+
+# Views of the dataset over a date range, shared across sessions (see the sidebar filter)
+@cache_resource(max_entries=8)
+def date_range_view(version, start, stop):
+    return DateRangeView(open_dataset(), start, stop)
+
+# Derived tables and series live in the process-wide artifact cache (artifacts.py): one
+# read-only copy shared by every session, evicted least recently used under a memory cap.
+# They are keyed by dataset (or view) version so the data are not hashed on every rerun.
+@artifacts.shared
+def describe_data(_dataset, version, station_names):
+    return analytics.describe(_dataset, list(station_names))
+
+@artifacts.shared
+def record_counts(_hourly_cube, version, station_names):
+    return analytics.record_counts(_hourly_cube, list(station_names))
+
+@artifacts.shared
+def yearly_medians(_dataset, version, column, station_names):
+    rows = analytics.period_rows(_dataset, list(station_names), columns=['year', 'station', column])
+    return analytics.yearly_medians(rows, column)
+
+# Binned point density summed over the station slices on shared edges,
+# computed once per factor and station set
+@artifacts.shared
+def scatter_density(_dataset, version, factor, station_names):
+    return analytics.scatter_density(_dataset, factor, list(station_names))
 
-# Preprocess data
-data, dongsi_data, wanliu_data = preprocess_data(data)
+@artifacts.shared
+def scatter_sample(_dataset, version, factor, station_names):
+    return analytics.scatter_sample(_dataset, factor, list(station_names))
+
+# Histogram bins, reading only the plotted column of the selected stations
+@artifacts.shared
+def histogram_bins(_dataset, version, column, station_names, by='station', bins=50):
+    rows = analytics.period_rows(_dataset, list(station_names), columns=[column, by])
+    return analytics.histogram(rows, column, by=by, bins=bins)
+
+# Daily series of a station from the daily cube
+@artifacts.shared
+def create_daily_data(_daily_cube, station, version):
+    return analytics.daily_series(_daily_cube, station)
+
+# Decompositions of the whole record of the stations with sufficient data
+# (kept per station version, cycle and method by the decomposer as well)
+@artifacts.shared
+def decompose_stations(_decomposer, version, station_names, period_label, method):
+    return _decomposer.decompose(list(station_names), period_label, method)
+
+# Lagged cross-correlations of every measurement pair per station (lagcorr.py), the
+# stations missing from the cache computed in one batch
+@artifacts.shared
+def lagged_correlations(_dataset, version, station_names):
+    import lagcorr
+    return lagcorr.station_correlations(_dataset, list(station_names))
 
 # Sidebar for navigation
 st.sidebar.title("Navigation")
@@ -89,8 +174,237 @@ page = st.sidebar.radio("Select Analysis",
                           "Annual Trends", 
                           "Distribution Analysis",
                           "Further Analysis",
+                          "Pollution Episodes",
                           "Summary"])
 
+# Stations shown on every page; pages read only the partitions of the selected stations
+default_stations = [name for name in ["Dongsi", "Wanliu"] if name in stations] or stations[:2]
+selected_stations = st.sidebar.multiselect("Select Stations", stations, default=default_stations)
+if not selected_stations:
+    st.warning("Select at least one station in the sidebar.")
+    st.stop()
+
+# Date range applied by every page, the whole record by default. Station rows are
+# sorted by date, so a narrower range is a binary-searched slice of each station
+# and its aggregates are built from those slices only.
+first_day, last_day = (day.date() for day in dataset.date_span())
+picked_days = st.sidebar.date_input("Date range", value=(first_day, last_day),
+                                    min_value=first_day, max_value=last_day)
+start_day, end_day = picked_days[0], picked_days[1] if len(picked_days) > 1 else last_day
+date_range = None
+view = dataset
+if (start_day, end_day) != (first_day, last_day):
+    date_range = (pd.Timestamp(start_day), pd.Timestamp(end_day) + pd.Timedelta(days=1))
+    try:
+        view = date_range_view(dataset.version, *date_range)
+    except ValueError as e:
+        st.warning(f"{e}. Select another date range in the sidebar.")
+        st.stop()
+
+# Aggregate cubes (station x year x month x hour / day) and mergeable moments per
+# station x year x month for correlations and trendlines, over the date range
+data_version = view.version
+hourly_cube, daily_cube = view.hourly_cube, view.daily_cube
+moments = view.moments
+
+# Built figures shared across sessions, keyed by (page, widget params, data version):
+# repeated views skip building the figure
+@artifacts.shared
+def page_figure(page, params, version, _build):
+    return _build()
+
+# Charts of the pages, built through page_figure. The page branches and the background
+# precomputation call them with the same widget values, so they share the built figures.
+def count_chart(name):
+    counts = record_counts(hourly_cube, data_version, tuple(stations))
+    builds = {'records_by_station': lambda: figures.station_pie(counts['station']),
+              'records_by_year': lambda: figures.count_bar(counts['year'], 'Year', "Records by Year"),
+              'records_by_month': lambda: figures.count_bar(counts['month'], 'Month', "Records by Month")}
+    return page_figure("Overview", name, data_version, builds[name])
+
+def hourly_profile_chart(year=None):
+    if year is None:
+        return page_figure("Daily PM10 Patterns", ('hourly_profile', tuple(selected_stations)), data_version,
+                           lambda: figures.hourly_profile(analytics.hourly_profile(hourly_cube, selected_stations),
+                                                          station_colors, 'Daily Pattern of PM10 (2013-2017)'))
+    return page_figure("Daily PM10 Patterns", ('hourly_profile', tuple(selected_stations), year), data_version,
+                       lambda: figures.hourly_profile(
+                           analytics.hourly_profile(hourly_cube, selected_stations, years=[year]),
+                           station_colors, f'Daily Pattern of PM10 Concentrations in {year}',
+                           y_title='Average PM10 Concentration'))
+
+def correlation_chart(station_name=None):
+    if station_name is None:
+        return page_figure("Meteorological Correlations", ('correlation', tuple(selected_stations)), data_version,
+                           lambda: figures.correlation_heatmap(analytics.correlation_matrix(moments, selected_stations),
+                                                               'Correlation Between PM10 and Meteorological Factors'))
+    return page_figure("Meteorological Correlations", ('correlation', station_name), data_version,
+                       lambda: figures.correlation_heatmap(
+                           analytics.correlation_matrix(moments, [station_name]),
+                           f'{station_name} Station: Correlation Between PM10 and Meteorological Factors'))
+
+# Correlation of every measurement at hour t with the target at t + lag, for one station
+def lag_heatmap_chart(station_name, target):
+    def build():
+        result = lagged_correlations(view, data_version, tuple(selected_stations))[station_name]
+        columns = result['columns']
+        return figures.lag_heatmap(result['lags'], columns, result['correlation'][:, columns.index(target)], target,
+                                   f'{station_name} Station: Lagged Correlation with {target}')
+    return page_figure("Meteorological Correlations", ('lag_heatmap', tuple(selected_stations), station_name, target),
+                       data_version, build)
+
+def lag_curves_chart(station_name, target, variables):
+    def build():
+        result = lagged_correlations(view, data_version, tuple(selected_stations))[station_name]
+        columns = result['columns']
+        curves = {column: result['correlation'][columns.index(column), columns.index(target)] for column in variables}
+        return figures.lag_curves(result['lags'], curves, target,
+                                  f'{station_name} Station: {target} Correlation by Lag')
+    return page_figure("Meteorological Correlations",
+                       ('lag_curves', tuple(selected_stations), station_name, target, tuple(variables)),
+                       data_version, build)
+
+# Binned density and optional sample from the artifact cache; trendline from the merged moments
+def scatter_chart(factor, show_sample):
+    def build():
+        counts, x_edges, y_edges = scatter_density(view, data_version, factor, tuple(selected_stations))
+        fit = analytics.linear_fit(moments, selected_stations, factor)
+        samples = scatter_sample(view, data_version, factor, tuple(selected_stations)) if show_sample else ()
+        return figures.scatter_density(counts, x_edges, y_edges, fit, factor, station_colors, samples)
+    return page_figure("Meteorological Correlations", ('scatter', factor, tuple(selected_stations), show_sample),
+                       data_version, build)
+
+def yearly_means_chart():
+    return page_figure("Annual Trends", ('yearly_means', tuple(selected_stations)), data_version,
+                       lambda: figures.trend_lines(analytics.yearly_means(hourly_cube, selected_stations), 'year',
+                                                   station_colors, 'Yearly Average PM10 (2013-2017)', 'Year',
+                                                   tick0=min(hourly_cube.values('year'))))
+
+# Monthly averages of a year, rolled up from the cube cells of that year
+def monthly_means_chart(year):
+    return page_figure("Annual Trends", ('monthly_means', tuple(selected_stations), year), data_version,
+                       lambda: figures.trend_lines(
+                           analytics.monthly_means(hourly_cube, selected_stations, years=[year]), 'month',
+                           station_colors, f'Monthly Average PM10 in {year}', 'Month', tick0=1))
+
+# PM10 histogram summed over the stations with a line for the mean, or one
+# series per station with a line for each station's mean
+def pm10_histogram_chart(by_station):
+    def overall_histogram():
+        edges, counts = histogram_bins(view, data_version, 'PM10', tuple(selected_stations))
+        counts = sum(counts.get(station_name, 0 * edges[1:]) for station_name in selected_stations)
+        mean_pm10 = hourly_cube.mean('PM10', station=selected_stations)
+        return figures.histogram(edges, counts, 'Distribution of PM10 ', 'PM10', mean=mean_pm10)
+    
+    def station_histograms():
+        edges, counts = histogram_bins(view, data_version, 'PM10', tuple(selected_stations))
+        station_means = analytics.station_means(hourly_cube, selected_stations)
+        return figures.histogram(edges, counts, 'Distribution of PM10 Concentrations by Station', 'PM10 Concentration',
+                                 station_colors, selected_stations, station_means=station_means)
+    
+    if by_station:
+        return page_figure("Distribution Analysis", ('pm10_station_histograms', tuple(selected_stations)),
+                           data_version, station_histograms)
+    return page_figure("Distribution Analysis", ('pm10_histogram', tuple(selected_stations)), data_version,
+                       overall_histogram)
+
+def box_chart(accuracy):
+    return page_figure("Distribution Analysis", ('pm10_boxes', tuple(selected_stations), accuracy), data_version,
+                       lambda: figures.box_plots(analytics.box_stats(view, selected_stations, 'PM10', accuracy),
+                                                 station_colors))
+
+def factor_histogram_chart(factor):
+    return page_figure("Distribution Analysis", ('histogram', factor, tuple(selected_stations)), data_version,
+                       lambda: figures.histogram(*histogram_bins(view, data_version, factor, tuple(selected_stations)),
+                                                 f'Distribution of {factor} by Station', factor,
+                                                 station_colors, selected_stations))
+
+def daily_means_chart():
+    def build():
+        daily = {station_name: create_daily_data(daily_cube, station_name, view.station_versions.get(station_name))
+                 for station_name in selected_stations}
+        return figures.daily_lines(daily, station_colors)
+    return page_figure("Further Analysis", ('daily_means', tuple(selected_stations)), data_version, build)
+
+# Decompositions of the stations with sufficient data over the date range and their
+# chart (None when no station has enough data)
+def decomposition_chart(period_label, method, decomposer):
+    decompositions = decompose_stations(decomposer, dataset.version, tuple(selected_stations), period_label, method.lower())
+    if date_range is not None:
+        # Components of the whole series, shown over the date range
+        decompositions = {station_name: date_slice(decomp_data, *date_range)
+                          for station_name, decomp_data in decompositions.items()}
+    if not decompositions:
+        return decompositions, None
+    # Decomposition components, one panel each with a shared date axis
+    return decompositions, page_figure("Further Analysis", ('decomposition', tuple(selected_stations), period_label, method),
+                                       data_version, lambda: figures.decomposition(
+                                           decompositions, station_colors, f'PM10 Decomposition ({period_label}, {method})'))
+
+# Background precomputation (precompute.py): once this page is on screen, the artifacts the
+# other pages need for the same selection and date range are computed on a worker thread,
+# pages visited most often first. A page then finds them in the artifact cache or waits
+# for the computation in progress. DASHBOARD_PRECOMPUTE_WORKERS=0 turns it off.
+# Tasks run off the script thread, so they get the cached resources they use (dataset,
+# decomposer) as arguments instead of calling the Streamlit caches.
+@cache_resource
+def open_scheduler():
+    scheduler = precompute.Scheduler(workers=int(os.environ.get('DASHBOARD_PRECOMPUTE_WORKERS', 1)))
+    instrumentation.register_stats('precompute', scheduler.stats)
+    return scheduler
+
+# Tables and charts each page shows with its default widget values: {page: {task: function}}
+def page_tasks():
+    import decomposition
+    import exposure
+    decomposer = open_decomposer()
+    years = hourly_cube.values('year')
+    return {
+        "Overview": {
+            'describe': lambda: describe_data(view, data_version, tuple(stations)),
+            **{name: lambda name=name: count_chart(name)
+               for name in ['records_by_station', 'records_by_year', 'records_by_month']},
+        },
+        "Daily PM10 Patterns": {
+            'hourly_profile': hourly_profile_chart,
+            'hourly_profile_year': lambda: hourly_profile_chart(years[0]),
+        },
+        "Meteorological Correlations": {
+            'correlation': correlation_chart,
+            **{f'correlation_{station_name}': lambda station_name=station_name: correlation_chart(station_name)
+               for station_name in selected_stations},
+            'scatter': lambda: scatter_chart(analytics.METEO_FACTORS[0], False),
+            'lag_heatmap': lambda: lag_heatmap_chart(selected_stations[0], 'PM10'),
+            'lag_curves': lambda: lag_curves_chart(selected_stations[0], 'PM10', analytics.METEO_FACTORS),
+        },
+        "Annual Trends": {
+            'yearly_means': yearly_means_chart,
+            'monthly_means': lambda: monthly_means_chart(years[0]),
+            'yearly_medians': lambda: yearly_medians(view, data_version, 'PM10', tuple(selected_stations)),
+        },
+        "Distribution Analysis": {
+            'pm10_histogram': lambda: pm10_histogram_chart(False),
+            'pm10_station_histograms': lambda: pm10_histogram_chart(True),
+            'pm10_boxes': lambda: box_chart(0.01),
+            'histogram': lambda: factor_histogram_chart(analytics.METEO_FACTORS[0]),
+        },
+        "Further Analysis": {
+            'daily_means': daily_means_chart,
+            'decomposition': lambda: decomposition_chart(list(decomposition.PERIODS)[-1], "classical", decomposer),
+        },
+        "Pollution Episodes": {
+            f'rolling_{station_name}': lambda station_name=station_name:
+            exposure.station_rolling_means(view, station_name, 'PM10', exposure.WINDOWS['24-hour'])
+            for station_name in selected_stations
+        },
+    }
+
+scheduler = open_scheduler()
+if st.session_state.get('visited_page') != page:
+    st.session_state['visited_page'] = page
+    scheduler.visit(page)
+
+page_stage = profile.start('page', page=page)
 
 
 # Overview page
@@ -99,11 +413,11 @@ if page == "Overview":
     
     # Display basic statistics
     st.subheader("Basic Statistics")
-    st.dataframe(data.describe())
+    st.dataframe(describe_data(view, data_version, tuple(stations)))
     
     # Station information
     st.subheader("Station Information")
-    station_counts = data['station'].value_counts()
+    station_counts = record_counts(hourly_cube, data_version, tuple(stations))['station']
     
     col1, col2 = st.columns(2)
     with col1:
@@ -111,26 +425,17 @@ if page == "Overview":
         st.dataframe(station_counts)
     
     with col2:
-        fig = px.pie(values=station_counts.values, names=station_counts.index, 
-                     title="Data Distribution by Station")
-        st.plotly_chart(fig)
+        plotly_chart(count_chart('records_by_station'))
     
     # Year and month distribution
     st.subheader("Temporal Distribution")
     
-    year_counts = data['year'].value_counts().sort_index()
-    month_counts = data['month'].value_counts().sort_index()
-    
     col1, col2 = st.columns(2)
     with col1:
-        fig = px.bar(x=year_counts.index, y=year_counts.values, 
-                     labels={'x': 'Year', 'y': 'Count'}, title="Records by Year")
-        st.plotly_chart(fig)
+        plotly_chart(count_chart('records_by_year'))
     
     with col2:
-        fig = px.bar(x=month_counts.index, y=month_counts.values, 
-                     labels={'x': 'Month', 'y': 'Count'}, title="Records by Month")
-        st.plotly_chart(fig)
+        plotly_chart(count_chart('records_by_month'))
 
 
 
@@ -138,30 +443,10 @@ if page == "Overview":
 elif page == "Daily PM10 Patterns":
     st.header("Question 1: Daily Pattern of PM10 Concentrations")
     
-    # Calculate hourly averages
-    dongsi_hourly = dongsi_data.groupby('hour_of_day')['PM10'].mean().reset_index()
-    wanliu_hourly = wanliu_data.groupby('hour_of_day')['PM10'].mean().reset_index()
-    
     # Combined hourly averages plot
     st.subheader("Average PM10 by Hour of Day")
     
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=dongsi_hourly['hour_of_day'], y=dongsi_hourly['PM10'],
-                             mode='lines+markers', name='Dongsi Station',
-                             line=dict(color='blue', width=2)))
-    fig.add_trace(go.Scatter(x=wanliu_hourly['hour_of_day'], y=wanliu_hourly['PM10'],
-                             mode='lines+markers', name='Wanliu Station',
-                             line=dict(color='red', width=2)))
-    
-    fig.update_layout(
-        title='Daily Pattern of PM10 (2013-2017)',
-        xaxis_title='Hour of Day',
-        yaxis_title='Average PM10',
-        xaxis=dict(tickmode='linear', tick0=0, dtick=1),
-        legend=dict(y=0.99, x=0.99, xanchor='right', yanchor='top'),
-        hovermode='x unified'
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(hourly_profile_chart(), use_container_width=True)
     
     # Insight about the daily pattern
     st.info("""
@@ -178,53 +463,22 @@ elif page == "Daily PM10 Patterns":
     # Yearly patterns
     st.subheader("Daily Patterns by Year")
     
-    years = sorted(data['year'].unique())
+    years = hourly_cube.values('year')
     selected_year = st.selectbox("Select Year for Detailed View", years)
     
-    dongsi_year = dongsi_data[dongsi_data['year'] == selected_year]
-    wanliu_year = wanliu_data[wanliu_data['year'] == selected_year]
-    
-    dongsi_year_hourly = dongsi_year.groupby('hour_of_day')['PM10'].mean().reset_index()
-    wanliu_year_hourly = wanliu_year.groupby('hour_of_day')['PM10'].mean().reset_index()
-    
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=dongsi_year_hourly['hour_of_day'], y=dongsi_year_hourly['PM10'],
-                             mode='lines+markers', name='Dongsi Station',
-                             line=dict(color='blue', width=2)))
-    fig.add_trace(go.Scatter(x=wanliu_year_hourly['hour_of_day'], y=wanliu_year_hourly['PM10'],
-                             mode='lines+markers', name='Wanliu Station',
-                             line=dict(color='red', width=2)))
-    
-    fig.update_layout(
-        title=f'Daily Pattern of PM10 Concentrations in {selected_year}',
-        xaxis_title='Hour of Day',
-        yaxis_title='Average PM10 Concentration',
-        xaxis=dict(tickmode='linear', tick0=0, dtick=1),
-        legend=dict(y=0.99, x=0.99, xanchor='right', yanchor='top'),
-        hovermode='x unified'
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(hourly_profile_chart(selected_year), use_container_width=True)
 
 # Meteorological Correlations page
 elif page == "Meteorological Correlations":
     st.header("Question 2: Correlation Between Meteorological Factors and PM10")
     
-    # Overall correlations 
+    # Overall correlations across the selected stations
     st.subheader("Overall Correlation Analysis")
     
     # Calculate correlations Between PM10 and Meteorology Parameter 
     # Meteorology Parameter(TEMP, DEWP, PRES)
-    corr_features = ['PM10', 'TEMP', 'DEWP', 'PRES']
-    correlation = data[corr_features].corr()
-    
     # Display correlation matrix
-    fig = px.imshow(correlation, 
-                    text_auto=True, 
-                    color_continuous_scale='RdBu_r',
-                    labels=dict(color="Correlation"),
-                    zmin=-1, zmax=1)
-    fig.update_layout(title='Correlation Between PM10 and Meteorological Factors')
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(correlation_chart(), use_container_width=True)
     
     # Insight
     st.info("""
@@ -239,95 +493,63 @@ elif page == "Meteorological Correlations":
     # Station-specific correlations
     st.subheader("Station-Specific Correlation Analysis")
     
-    tab1, tab2 = st.tabs(["Dongsi Station", "Wanliu Station"])
+    tabs = st.tabs([f"{station_name} Station" for station_name in selected_stations])
     
-    with tab1:
-        dongsi_corr = dongsi_data[corr_features].corr()
-        fig = px.imshow(dongsi_corr, 
-                        text_auto=True, 
-                        color_continuous_scale='RdBu_r',
-                        labels=dict(color="Correlation"),
-                        zmin=-1, zmax=1)
-        fig.update_layout(title='Dongsi Station: Correlation Between PM10 and Meteorological Factors')
-        st.plotly_chart(fig, use_container_width=True)
-
-    with tab2:
-        wanliu_corr = wanliu_data[corr_features].corr()
-        fig = px.imshow(wanliu_corr, 
-                        text_auto=True, 
-                        color_continuous_scale='RdBu_r',
-                        labels=dict(color="Correlation"),
-                        zmin=-1, zmax=1)
-        fig.update_layout(title='Wanliu Station: Correlation Between PM10 and Meteorological Factors')
-        st.plotly_chart(fig, use_container_width=True)
+    for tab, station_name in zip(tabs, selected_stations):
+        with tab:
+            plotly_chart(correlation_chart(station_name), use_container_width=True)
 
     # Scatter plots
     st.subheader("Scatter Plots: PM10 vs Meteorological Factors")
     
-    meteo_factor = st.selectbox("Select Meteorological Factor", ["TEMP", "DEWP", "PRES"])
+    meteo_factor = st.selectbox("Select Meteorological Factor", analytics.METEO_FACTORS)
+    show_sample = st.checkbox("Overlay a random sample of points", value=False)
     
-    fig = px.scatter(data, x=meteo_factor, y='PM10', color='station', opacity=0.5,
-                     trendline='ols', trendline_scope='overall',
-                     title=f'PM10 vs {meteo_factor} by Station',
-                     labels={'PM10': 'PM10'})
-    
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(scatter_chart(meteo_factor, show_sample), use_container_width=True)
+
+    # Lagged correlations: meteorology often acts on PM10 hours later
+    st.subheader("Lagged Correlation Analysis")
+    import lagcorr
+    lag_station = st.selectbox("Select Station", selected_stations, key='lag_station')
+    lag_columns = lagged_correlations(view, data_version, tuple(selected_stations))[lag_station]['columns']
+    lag_target = st.selectbox("Correlate with", lag_columns, index=lag_columns.index('PM10'), key='lag_target')
+    st.write(f"Correlation of each variable at hour t with {lag_target} at hour t + lag, up to "
+             f"{lagcorr.MAX_LAG} hours either way, over the hours where both values exist. "
+             f"A positive lag means {lag_target} follows the variable.")
+
+    plotly_chart(lag_heatmap_chart(lag_station, lag_target), use_container_width=True)
+
+    lag_variables = st.multiselect("Variables", [column for column in lag_columns if column != lag_target],
+                                   default=[f for f in analytics.METEO_FACTORS if f != lag_target], key='lag_variables')
+    if lag_variables:
+        plotly_chart(lag_curves_chart(lag_station, lag_target, lag_variables), use_container_width=True)
+
+    st.write("Strongest correlation per variable")
+    st.dataframe(lagcorr.peak_lags(lagged_correlations(view, data_version, tuple(selected_stations))[lag_station],
+                                   lag_target).round(3))
     
 
 # Annual Trends page
 elif page == "Annual Trends":
     st.header("Annual Trends Analysis")
     
-    # Calculate yearly averages
-    yearly_avg = data.groupby(['year', 'station'])['PM10'].mean().reset_index()
-    
     # Plot yearly trends
     st.subheader("Yearly Average PM10")
     
-    fig = px.line(yearly_avg, x='year', y='PM10', color='station',
-                  markers=True, line_shape='linear',
-                  title='Yearly Average PM10 (2013-2017)',
-                  labels={'PM10': 'Average PM10', 'year': 'Year'})
-    
-    fig.update_layout(
-        xaxis=dict(tickmode='linear', tick0=min(data['year']), dtick=1),
-        legend=dict(y=0.99, x=0.01, xanchor='left', yanchor='top'),
-        hovermode='x unified'
-    )
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Calculate monthly averages by year
-    monthly_avg = data.groupby(['year', 'month', 'station'])['PM10'].mean().reset_index()
+    plotly_chart(yearly_means_chart(), use_container_width=True)
     
     # Plot monthly trends
     st.subheader("Monthly Average PM10 by Year")
     
-    selected_year = st.selectbox("Select Year", sorted(data['year'].unique()), key="monthly_trends")
-    year_data = monthly_avg[monthly_avg['year'] == selected_year]
-    
-    fig = px.line(year_data, x='month', y='PM10', color='station',
-                  markers=True, line_shape='linear',
-                  title=f'Monthly Average PM10 in {selected_year}',
-                  labels={'PM10': 'Average PM10', 'month': 'Month'})
-    
-    fig.update_layout(
-        xaxis=dict(tickmode='linear', tick0=1, dtick=1),
-        legend=dict(y=0.99, x=0.01, xanchor='left', yanchor='top'),
-        hovermode='x unified'
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    selected_year = st.selectbox("Select Year", hourly_cube.values('year'), key="monthly_trends")
+    plotly_chart(monthly_means_chart(selected_year), use_container_width=True)
     
     # Annual statistics table
     st.subheader("Annual PM10 Statistics by Station")
     
     # Calculate yearly statistics
-    yearly_stats = data.groupby(['year', 'station'])['PM10'].agg([
-        'mean', 'median', 'std', 'min', 'max'
-    ]).reset_index()
-    
-    # Format table for display
-    yearly_stats = yearly_stats.round(2)
-    yearly_stats.columns = ['Year', 'Station', 'Mean', 'Median', 'Std Dev', 'Min', 'Max']
+    yearly_stats = analytics.yearly_stats(hourly_cube, yearly_medians(view, data_version, 'PM10', tuple(selected_stations)),
+                                          selected_stations)
     
     # Display table
     st.dataframe(yearly_stats, use_container_width=True)
@@ -348,72 +570,37 @@ elif page == "Annual Trends":
 elif page == "Distribution Analysis":
     st.header("Distribution Analysis")
     
+    # Histogram bins and box statistics are computed server-side, once per dataset version
+    
     # PM10 distribution
     st.subheader("PM10 Distribution")
     
     tab1, tab2 = st.tabs(["Overall Distribution", "By Station"])
     
     with tab1:
-        fig = px.histogram(data, x='PM10', nbins=50,
-                          title='Distribution of PM10 ',
-                          labels={'PM10': 'PM10', 'count': 'Frequency'})
-        
-        # Add a vertical line for the mean
-        mean_pm10 = data['PM10'].mean()
-        fig.add_vline(x=mean_pm10, line_dash="dash", line_color="red")
-        fig.add_annotation(x=mean_pm10, y=0.9, yref="paper",
-                          text=f"Mean: {mean_pm10:.2f}",
-                          showarrow=True, arrowhead=1)
-        
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(pm10_histogram_chart(by_station=False), use_container_width=True)
     
     with tab2:
-        fig = px.histogram(data, x='PM10', color='station', nbins=50,
-                          barmode='overlay', opacity=0.7,
-                          title='Distribution of PM10 Concentrations by Station',
-                          labels={'PM10': 'PM10 Concentration', 'count': 'Frequency'})
-        
-        # Add vertical lines for the means
-        dongsi_mean = dongsi_data['PM10'].mean()
-        wanliu_mean = wanliu_data['PM10'].mean()
-        
-        fig.add_vline(x=dongsi_mean, line_dash="dash", line_color="blue")
-        fig.add_vline(x=wanliu_mean, line_dash="dash", line_color="red")
-        
-        fig.add_annotation(x=dongsi_mean, y=0.95, yref="paper",
-                          text=f"Dongsi Mean: {dongsi_mean:.2f}",
-                          showarrow=True, arrowhead=1, font=dict(color="blue"))
-        
-        fig.add_annotation(x=wanliu_mean, y=0.85, yref="paper",
-                          text=f"Wanliu Mean: {wanliu_mean:.2f}",
-                          showarrow=True, arrowhead=1, font=dict(color="red"))
-        
-        st.plotly_chart(fig, use_container_width=True)
+        plotly_chart(pm10_histogram_chart(by_station=True), use_container_width=True)
     
     # Box plots by station and year
     st.subheader("PM10 Distribution by Year and Station")
     
-    fig = px.box(data, x='year', y='PM10', color='station',
-                title='PM10 Distribution by Year and Station',
-                labels={'PM10': 'PM10 Concentration', 'year': 'Year'})
-    
-    st.plotly_chart(fig, use_container_width=True)
+    accuracy = st.select_slider("Box plot accuracy (maximum relative error of the quartiles)",
+                                options=[0.005, 0.01, 0.02, 0.05], value=0.01,
+                                format_func=lambda a: f"{a:.1%}")
+    plotly_chart(box_chart(accuracy), use_container_width=True)
     
     # Meteorological factors distribution
     st.subheader("Distribution of Meteorological Factors")
     
     meteo_factor = st.selectbox(
         "Select Meteorological Factor", 
-        ["TEMP", "DEWP", "PRES"],
+        analytics.METEO_FACTORS,
         key="meteo_dist"
     )
     
-    fig = px.histogram(data, x=meteo_factor, color='station', nbins=50,
-                      barmode='overlay', opacity=0.7,
-                      title=f'Distribution of {meteo_factor} by Station',
-                      labels={meteo_factor: meteo_factor, 'count': 'Frequency'})
-    
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(factor_histogram_chart(meteo_factor), use_container_width=True)
     
     # Insight
     st.info(f"""
@@ -427,6 +614,7 @@ elif page == "Distribution Analysis":
 
 # Further Analysis page
 elif page == "Further Analysis":
+    from decomposition import PERIODS
     st.header("Further Analysis")
     
     # Time Series Decomposition
@@ -437,66 +625,85 @@ elif page == "Further Analysis":
     to better understand the temporal patterns.
     """)
     
-    # Create daily aggregated data
-    @st.cache_data
-    def create_daily_data(station_data):
-        daily_data = station_data.groupby(pd.Grouper(key='date', freq='D'))['PM10'].mean().reset_index()
-        # Fill missing values using interpolation
-        daily_data['PM10'] = daily_data['PM10'].interpolate(method='linear')
-        return daily_data
-    
-    # Select station for decomposition
-    station = st.selectbox("Select Station for Decomposition", ["Dongsi", "Wanliu"])
-    station_data = dongsi_data if station == "Dongsi" else wanliu_data
+    # Plot the daily data
+    plotly_chart(daily_means_chart(), use_container_width=True)
     
-    daily_station_data = create_daily_data(station_data)
+    # Decomposition settings
+    col1, col2 = st.columns(2)
+    with col1:
+        period_label = st.selectbox("Seasonal cycle", list(PERIODS), index=len(PERIODS) - 1)
+    with col2:
+        method = st.radio("Method", ["classical", "STL"], horizontal=True)
     
-    # Plot the daily data
-    fig = px.line(daily_station_data, x='date', y='PM10',
-                 title=f'{station} Station: Daily Average PM10 Concentrations',
-                 labels={'PM10': 'PM10 Concentration', 'date': 'Date'})
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Perform decomposition if data is sufficient
-    if len(daily_station_data) > 365:
-        from statsmodels.tsa.seasonal import seasonal_decompose
-        
-        # Set date as index for decomposition
-        daily_station_data = daily_station_data.set_index('date')
-        
-        # Perform decomposition
-        decomposition = seasonal_decompose(daily_station_data['PM10'], model='additive', period=365)
-        
-        # Create dataframe from decomposition results
-        decomp_data = pd.DataFrame({
-            'original': daily_station_data['PM10'],
-            'trend': decomposition.trend,
-            'seasonal': decomposition.seasonal,
-            'residual': decomposition.resid
-        }).reset_index()
-        
-        # Plot decomposition components
-        components = ['original', 'trend', 'seasonal', 'residual']
-        titles = ['Original Data', 'Trend Component', 'Seasonal Component', 'Residual Component']
-        
-        for component, title in zip(components, titles):
-            fig = px.line(decomp_data, x='date', y=component,
-                         title=f'{title}',
-                         labels={component: 'Value', 'date': 'Date'})
-            st.plotly_chart(fig, use_container_width=True)
+    # Decompose the stations with sufficient data (cached per station version, cycle and method)
+    decompositions, fig = decomposition_chart(period_label, method, open_decomposer())
+    if fig is not None:
+        plotly_chart(fig, use_container_width=True)
         
         # Interpretation
         st.info("""
         **Decomposition Interpretation:**
         - **Trend Component:** Shows the long-term progression of PM10 concentrations over time, revealing whether pollution is generally increasing or decreasing.
-        - **Seasonal Component:** Captures the repeating annual pattern, showing how PM10 levels fluctuate throughout the year.
+        - **Seasonal Component:** Captures the repeating pattern of the selected cycle, showing how PM10 levels fluctuate through the day, the week or the year.
         - **Residual Component:** Represents the irregular fluctuations not explained by trend or seasonality, which could be related to special events or measurement errors.
         
         This decomposition helps us understand the different factors contributing to PM10 variations over time.
         """)
-    else:
-        st.error("Insufficient data for meaningful decomposition. Need at least 365 days of data.")
+    if len(decompositions) < len(selected_stations):
+        st.error(f"Insufficient data for meaningful decomposition. Need at least two full cycles ({period_label}).")
+    
+# Pollution Episodes page
+elif page == "Pollution Episodes":
+    import exposure
+    st.header("Pollution Episodes")
     
+    st.write("""
+    Rolling 24-hour and 8-hour means show how long pollution stays above a limit. An episode is a run of
+    consecutive hours whose rolling mean is above the limit. A window needs 75% of its hours measured,
+    so a longer gap in the record ends an episode.
+    """)
+    
+    # Episode settings; the limit defaults to the national standard of the pollutant and window
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        pollutants = [column for column in exposure.POLLUTANTS if column in dataset.columns]
+        pollutant = st.selectbox("Pollutant", pollutants, index=pollutants.index('PM10') if 'PM10' in pollutants else 0)
+    with col2:
+        window_label = st.radio("Rolling mean", list(exposure.WINDOWS), horizontal=True)
+        window = exposure.WINDOWS[window_label]
+    with col3:
+        limit = st.number_input("Limit (µg/m³)", min_value=0.0, step=5.0,
+                                value=float(exposure.default_limit(pollutant, window) or 0),
+                                key=f"episode_limit_{pollutant}_{window}")
+    
+    # Episodes of the selected stations over the date range (rolling means cached per station version)
+    episodes = exposure.station_episodes(view, selected_stations, pollutant, window, limit)
+    summary = exposure.episode_summary(episodes, selected_stations)
+    
+    st.subheader(f"{window_label} {pollutant} above {limit:g} µg/m³")
+    st.dataframe(summary.rename(columns={'episodes': 'Episodes', 'hours': 'Hours above limit',
+                                         'mean_duration': 'Mean duration (h)', 'longest': 'Longest (h)',
+                                         'peak': f'Peak {window_label} mean'}).round(1))
+    
+    if episodes.empty:
+        st.info("No episodes above the limit for the selected stations and date range.")
+    else:
+        params = (tuple(selected_stations), pollutant, window, limit)
+        fig = page_figure(page, ('episode_counts',) + params, data_version,
+                          lambda: figures.episode_counts(exposure.yearly_episode_counts(episodes), station_colors,
+                                                         f'{window_label} {pollutant} Episodes per Year'))
+        plotly_chart(fig, use_container_width=True)
+        
+        fig = page_figure(page, ('episode_timeline',) + params, data_version,
+                          lambda: figures.episode_timeline(episodes, station_colors,
+                                                           f'{window_label} {pollutant} Episode Durations',
+                                                           f'Peak {window_label} mean'))
+        plotly_chart(fig, use_container_width=True)
+        
+        # Longest episodes
+        st.subheader("Longest Episodes")
+        st.dataframe(episodes.nlargest(10, 'duration').reset_index(drop=True).round({'peak': 1}))
+
 # Distribution Analysis page
 elif page == "Summary":
     st.header("Project Summary")
@@ -544,4 +751,26 @@ elif page == "Summary":
     2. **How do meteorological factors correlate with PM10 concentrations?**  
     The correlation analysis quantified the relationships between PM10 and temperature, dew point, and pressure, finding weak but consistent patterns.    
 """)
+
+profile.stop(page_stage)
+
+# Queue the other pages' tasks (completed ones are not queued again)
+for task_page, tasks in page_tasks().items():
+    if task_page != page:
+        for name, task in tasks.items():
+            scheduler.schedule(task_page, (data_version, tuple(selected_stations), task_page, name), task)
+
+# Once the page is on screen, import the optional analytics modules in the
+# background (once per process) so the first visit to those pages does not pay for it
+@cache_resource
+def warm_imports():
+    def load():
+        import plotly.subplots
+        import decomposition
+        import statsmodels.tsa.seasonal
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    return thread
+warm_imports()
+profile.finish(st)
         
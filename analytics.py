@@ -0,0 +1,153 @@
+# Computations behind the dashboard pages, usable without Streamlit
+#
+# Every function takes the Dataset (see ingest.py) or one of its aggregates
+# plus the stations to cover and, optionally, the years to restrict to
+# (None for the whole record). Hourly rows are requested through
+# Dataset.rows() with only the columns a page plots, so an out-of-core dataset
+# reads just those partitions and columns. The dashboard wraps these in its
+# caches; reports.py calls them directly to render static reports.
+import numpy as np
+import pandas as pd
+
+from aggregates import binned_counts, density_grid, merge_moments
+
+CORRELATION_FEATURES = ['PM10', 'TEMP', 'DEWP', 'PRES']
+METEO_FACTORS = ['TEMP', 'DEWP', 'PRES']
+
+
+# Cube filters for a station / year selection
+def _filters(stations, years=None):
+    filters = {'station': list(stations)}
+    if years is not None:
+        filters['year'] = list(years)
+    return filters
+
+
+# Hourly rows of the stations, restricted to the given years
+def period_rows(dataset, stations, years=None, columns=None):
+    return dataset.rows(stations, columns, years)
+
+
+# Overview page: DataFrame.describe() of the numeric and date columns, with
+# exact quartiles. Those need every value, so each station's rows are read once
+# (past the artifact cache) and the columns kept in their stored dtypes until
+# each is described.
+def describe(dataset, stations, years=None):
+    columns = list(dataset.head(1).select_dtypes(['number', 'datetime']).columns)
+    values = {column: [] for column in columns}
+    for station in stations:
+        rows = dataset.rows([station], columns, years, cache=False)
+        for column in columns:
+            values[column].append(rows[column].to_numpy())
+    table = {}
+    for column in columns:
+        series = pd.Series(np.concatenate(values.pop(column)))
+        table[column] = (series if series.dtype.kind == 'M' else series.astype('float64')).describe()
+    # Rows in describe()'s order: the labels of the shortest description first
+    labels = dict.fromkeys(label for description in sorted(table.values(), key=len) for label in description.index)
+    return pd.DataFrame(table).reindex(list(labels))
+
+
+# Overview page: record counts per station, year and month
+def record_counts(hourly_cube, stations, years=None):
+    filters = _filters(stations, years)
+    return {
+        'station': hourly_cube.count(['station'], **filters).sort_values(ascending=False).rename('count'),
+        'year': hourly_cube.count(['year'], **filters).rename('count'),
+        'month': hourly_cube.count(['month'], **filters).rename('count'),
+    }
+
+
+# Mean of a column by hour of day, one column per station
+def hourly_profile(hourly_cube, stations, column='PM10', years=None):
+    return pd.DataFrame({station: hourly_cube.mean(column, ['hour'], **_filters([station], years))
+                         for station in stations})
+
+
+def correlation_matrix(moments, stations, features=CORRELATION_FEATURES, years=None):
+    return merge_moments(moments, **_filters(stations, years)).correlation(features)
+
+
+# OLS fit of y on x over the stations: (slope, intercept, n)
+def linear_fit(moments, stations, x, y='PM10', years=None):
+    return merge_moments(moments, **_filters(stations, years)).linear_fit(x, y)
+
+
+# Binned point density of (factor, y) summed over the stations on shared edges
+def scatter_density(dataset, factor, stations, y='PM10', years=None, bins=80):
+    filters = _filters(stations, years)
+    x_edges = np.linspace(dataset.hourly_cube.min(factor, **filters), dataset.hourly_cube.max(factor, **filters), bins + 1)
+    y_edges = np.linspace(dataset.hourly_cube.min(y, **filters), dataset.hourly_cube.max(y, **filters), bins + 1)
+    counts = np.zeros((bins, bins))
+    for station in stations:
+        rows = period_rows(dataset, [station], years, [factor, y])
+        counts += density_grid(rows[factor], rows[y], bins=(x_edges, y_edges))[0]
+    return counts, x_edges, y_edges
+
+
+# A random sample of (factor, y) points per station: [(station, rows)]
+def scatter_sample(dataset, factor, stations, y='PM10', years=None, size=2000):
+    samples = []
+    for station in stations:
+        valid = period_rows(dataset, [station], years, [factor, y]).dropna()
+        samples.append((station, valid.sample(n=min(size // len(stations), len(valid)), random_state=0)))
+    return samples
+
+
+# Annual Trends page: means in long format (year, [month,] station, column)
+def yearly_means(hourly_cube, stations, column='PM10', years=None):
+    return hourly_cube.mean(column, ['year', 'station'], **_filters(stations, years)).rename(column).reset_index()
+
+
+def monthly_means(hourly_cube, stations, column='PM10', years=None):
+    return hourly_cube.mean(column, ['year', 'month', 'station'], **_filters(stations, years)).rename(column).reset_index()
+
+
+def yearly_medians(frame, column='PM10'):
+    return frame.groupby(['year', 'station'], observed=True)[column].median()
+
+
+# Mean, median, standard deviation and range per year and station
+def yearly_stats(hourly_cube, medians, stations, column='PM10', years=None):
+    filters = _filters(stations, years)
+    stats = pd.DataFrame({
+        'mean': hourly_cube.mean(column, ['year', 'station'], **filters),
+        'median': medians,
+        'std': hourly_cube.std(column, ['year', 'station'], **filters),
+        'min': hourly_cube.min(column, ['year', 'station'], **filters),
+        'max': hourly_cube.max(column, ['year', 'station'], **filters),
+    }).dropna(subset=['mean']).reset_index().round(2)
+    stats.columns = ['Year', 'Station', 'Mean', 'Median', 'Std Dev', 'Min', 'Max']
+    return stats
+
+
+# Distribution page: histogram edges and counts per station
+def histogram(frame, column, by='station', bins=50):
+    return binned_counts(frame, column, by=by, bins=bins)
+
+
+# Overall mean of a column per station: {station: mean}
+def station_means(hourly_cube, stations, column='PM10', years=None):
+    return {station: hourly_cube.mean(column, **_filters([station], years)) for station in stations}
+
+
+# Box statistics per station from the quantile sketches: {station: (years, stats)}
+def box_stats(dataset, stations, column='PM10', relative_accuracy=0.01, years=None):
+    sketches = dataset.sketches(column, relative_accuracy)
+    boxes = {}
+    for station in stations:
+        keys = [year for s, year in sketches if s == station and (years is None or year in years)]
+        if keys:
+            boxes[station] = (keys, [sketches[(station, year)].box_stats() for year in keys])
+    return boxes
+
+
+# Further Analysis page: gap-free daily means of one station
+def daily_series(daily_cube, station, column='PM10', years=None):
+    daily = daily_cube.mean(column, ['year', 'month', 'day'], **_filters([station], years))
+    dates = pd.to_datetime(daily.index.to_frame(index=False))
+    daily = pd.Series(daily.values, index=dates).asfreq('D')
+    daily = daily.rename_axis('date').reset_index(name=column)
+    # Fill missing values using interpolation
+    daily[column] = daily[column].interpolate(method='linear')
+    return daily
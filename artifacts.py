@@ -0,0 +1,162 @@
+# Process-wide cache of derived artifacts, shared read-only by every session
+#
+# st.cache_data pickles each result and hands every session its own copy on
+# every hit, so memory and CPU grow with the number of viewers. Derived
+# artifacts (station slices, daily series, histograms, decompositions,
+# figures) are kept here once per process instead: a hit returns the very
+# same object.
+# NumPy arrays in a result are marked read-only, and pandas objects are
+# copy-on-write (always from pandas 3; the dashboard switches it on for pandas
+# 2), so no session can change what the others see. This module leaves the
+# pandas options alone: callers on pandas 2 without copy-on-write must not
+# modify cached frames in place.
+#
+# Entries are evicted least recently used first once their estimated size
+# passes the cap (DASHBOARD_CACHE_MB, default 256 MB). Concurrent misses on
+# one key compute it once; the other callers wait for that result. Hits,
+# misses and evictions are counted (stats(), and the instrumentation panel
+# and metrics when profiling is enabled).
+import functools
+import inspect
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get('DASHBOARD_CACHE_MB', 256)) * 2 ** 20)
+
+
+# Estimated bytes held by a cached value
+def nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(k) + nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(nbytes(v) for v in value)
+    if hasattr(value, 'to_plotly_json'):
+        # Plotly figure: the size of its serialized spec
+        return len(value.to_json())
+    return sys.getsizeof(value)
+
+
+# Mark the NumPy arrays of a value read-only (pandas objects are copy-on-write)
+def freeze(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for item in value.values():
+            freeze(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            freeze(item)
+    return value
+
+
+class ArtifactCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, bytes), least recently used first
+        self._pending = {}  # key -> Future of a computation in progress
+        self._lock = threading.Lock()
+
+    # Cached value of key, or None; counts a hit or a miss
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Cache a value and return it (frozen); values larger than the cap are not kept
+    def put(self, key, value):
+        freeze(value)
+        size = nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size <= self.max_bytes:
+                self._entries[key] = (value, size)
+                self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.bytes -= self._entries.popitem(last=False)[1][1]
+                self.evictions += 1
+        return value
+
+    # Cached value of key, computing it on a miss; returns (value, hit)
+    def get(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], True
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            return pending.result(), True
+        try:
+            value = self.put(key, compute())
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(value)
+        finally:
+            with self._lock:
+                del self._pending[key]
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+# The cache shared by the whole process
+CACHE = ArtifactCache()
+instrumentation.register_stats('artifact_cache', CACHE.stats)
+
+
+# Decorator caching a function's results in the shared cache. Like Streamlit's
+# caches, arguments whose names start with '_' are left out of the key, so
+# pass a version argument alongside unhashable ones such as the dataset.
+def shared(func):
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__module__, func.__qualname__) + tuple(
+            value for name, value in bound.arguments.items() if not name.startswith('_'))
+        value, hit = CACHE.get(key, lambda: func(*args, **kwargs))
+        instrumentation.current().cache_event(func.__name__, hit)
+        return value
+    return call
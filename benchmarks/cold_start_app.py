@@ -0,0 +1,95 @@
+# Cold-start benchmark for the dashboard: import time and first-render time
+#
+# Usage: python benchmarks/cold_start_app.py --csv data.csv [--repeat 5] [--record results.jsonl]
+# Each measurement runs in a fresh interpreter. The import phase executes the
+# dashboard's own top-level import statements, so it follows the script as it
+# changes. The render phase runs the whole script once with Streamlit's AppTest
+# against a store built from --csv, which it names as the data source so the
+# dashboard never fetches from the network. --record appends one JSON line per run
+# (commit, date, medians) so results can be compared across releases.
+import argparse
+import ast
+import datetime
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'air-quality-dashboard.py')
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'scipy', 'statsmodels']
+
+IMPORTS = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+exec(compile({source!r}, 'imports', 'exec'))
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in {heavy!r} if m in sys.modules]]))
+"""
+
+RENDER = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({script!r}, default_timeout=600)
+app.run()
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [str(e.value) for e in app.exception]]))
+"""
+
+
+# The script's top-level import statements as source
+def import_source(path):
+    tree = ast.parse(open(path, encoding='utf-8').read())
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def run(code, cwd, **fields):
+    env = dict(os.environ, DASHBOARD_DATA_SOURCE=os.path.join(cwd, 'data.csv'))
+    out = subprocess.run([sys.executable, '-c', code.format(**fields)], cwd=cwd, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', required=True, help='path to the downloaded data.csv')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--record', help='append the results as a JSON line to this file')
+    args = parser.parse_args()
+
+    source = import_source(SCRIPT)
+    imports = [run(IMPORTS, ROOT, root=ROOT, source=source, heavy=HEAVY_MODULES) for _ in range(args.repeat)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(args.csv, os.path.join(tmp, 'data.csv'))
+        # The first run builds the store; it is reported separately
+        first = run(RENDER, tmp, script=SCRIPT)
+        renders = [run(RENDER, tmp, script=SCRIPT) for _ in range(args.repeat)]
+
+    errors = first[1] + [e for _, errs in renders for e in errs]
+    import_ms = statistics.median(t for t, _ in imports) * 1000
+    render_ms = statistics.median(t for t, _ in renders) * 1000
+    print(f"Top-level imports   median {import_ms:8.1f} ms  heavy modules loaded: {', '.join(imports[0][1]) or 'none'}")
+    print(f"First render        median {render_ms:8.1f} ms  (store build run: {first[0] * 1000:.1f} ms)")
+    if errors:
+        print(f"Script raised: {errors[0]}")
+
+    if args.record:
+        with open(args.record, 'a') as f:
+            f.write(json.dumps({'commit': commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                                'import_ms': round(import_ms, 1), 'render_ms': round(render_ms, 1),
+                                'build_render_ms': round(first[0] * 1000, 1), 'heavy_modules': imports[0][1]}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
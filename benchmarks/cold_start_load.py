@@ -0,0 +1,71 @@
+# Cold-start comparison: CSV parse (old load_data path) vs memory-mapped store
+#
+# Usage: python benchmarks/cold_start_load.py --csv data.csv [--repeat 5]
+# Each measurement runs in a fresh interpreter so nothing is reused between runs.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CSV_PATH = """
+import time, pandas as pd
+start = time.perf_counter()
+df = pd.read_csv({csv!r})
+print(time.perf_counter() - start, df.memory_usage(deep=True).sum())
+"""
+
+BUILD_PATH = """
+import time, pandas as pd
+from data_store import compact_dtypes, create_store
+start = time.perf_counter()
+create_store({store!r}, compact_dtypes(pd.read_csv({csv!r})))
+print(time.perf_counter() - start, 0)
+"""
+
+STORE_PATH = """
+import time
+from data_store import read_store, frame_nbytes
+start = time.perf_counter()
+df = read_store({store!r})
+print(time.perf_counter() - start, frame_nbytes(df))
+"""
+
+
+def run(code, **paths):
+    out = subprocess.run([sys.executable, '-c', code.format(**paths)], cwd=ROOT,
+                         check=True, capture_output=True, text=True).stdout.split()
+    return float(out[0]), int(out[1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', required=True, help='path to the downloaded data.csv')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    csv = os.path.abspath(args.csv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = os.path.join(tmp, 'data.store')
+        build_time, _ = run(BUILD_PATH, csv=csv, store=store)
+        results = {
+            'read_csv (current)': [run(CSV_PATH, csv=csv) for _ in range(args.repeat)],
+            'mmap store': [run(STORE_PATH, store=store) for _ in range(args.repeat)],
+        }
+        # The partition files sit in station=<name>/year=<year> subdirectories
+        store_size = sum(os.path.getsize(os.path.join(directory, f))
+                         for directory, _, files in os.walk(store) for f in files)
+
+    print(f"CSV size: {os.path.getsize(csv) / 1e6:.1f} MB, store size: {store_size / 1e6:.1f} MB")
+    print(f"One-off store build: {build_time * 1000:.1f} ms")
+    for name, runs in results.items():
+        times = [t for t, _ in runs]
+        print(f"{name:20s} median {statistics.median(times) * 1000:8.1f} ms  "
+              f"min {min(times) * 1000:8.1f} ms  frame {runs[0][1] / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
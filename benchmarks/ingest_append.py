@@ -0,0 +1,57 @@
+# Incremental append cost vs. batch size and history size
+#
+# Usage: python benchmarks/ingest_append.py --csv data.csv
+# The CSV is split at several cut-off dates (history sizes); the hours right
+# after the cut-off are appended in batches of several sizes. Reports the
+# store append (append_batch) and the in-memory refresh (Dataset.refresh).
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_store import compact_dtypes, create_store  # noqa: E402
+from ingest import Dataset, append_batch  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', required=True, help='path to the downloaded data.csv')
+    parser.add_argument('--hours', type=int, nargs='+', default=[1, 24, 24 * 7, 24 * 30],
+                        help='batch sizes, in hours of data for every station')
+    parser.add_argument('--history', type=float, nargs='+', default=[0.25, 0.5, 0.9],
+                        help='history sizes, as fractions of the time span of the CSV')
+    args = parser.parse_args()
+
+    raw = pd.read_csv(args.csv)
+    dates = pd.to_datetime(raw[['year', 'month', 'day', 'hour']])
+    start, end = dates.min(), dates.max()
+
+    print(f"{'history rows':>12s} {'batch rows':>10s} {'append ms':>10s} {'refresh ms':>10s}")
+    for fraction in args.history:
+        cutoff = (start + (end - start) * fraction).floor('h')
+        for hours in args.hours:
+            batch = raw[(dates >= cutoff) & (dates < cutoff + pd.Timedelta(hours=hours))]
+            with tempfile.TemporaryDirectory() as tmp:
+                store = os.path.join(tmp, 'data.store')
+                history = raw[dates < cutoff]
+                create_store(store, compact_dtypes(history))
+                dataset = Dataset(store)
+
+                begin = time.perf_counter()
+                append_batch(store, batch)
+                appended = time.perf_counter()
+                dataset.refresh()
+                refreshed = time.perf_counter()
+                shutil.rmtree(store)
+            print(f"{len(history):12d} {len(batch):10d} {(appended - begin) * 1000:10.1f} "
+                  f"{(refreshed - appended) * 1000:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# Per-page payload and time-to-interactive benchmark for the dashboard
+#
+# Usage: python benchmarks/page_payloads.py --csv data.csv [--repeat 3] [--dwell 0] [--record results.jsonl]
+# Each repetition runs in a fresh interpreter with Streamlit's AppTest against
+# a store built from --csv (the store build is not timed). The app opens on
+# Overview and stays there --dwell seconds, which gives the background
+# precomputation time to run. Every page is then selected in turn: the first
+# visit runs the page cold, the second one again with the same widget values,
+# so the figure cache is warm. The time until the
+# script has sent every chart stands in for time to interactive on the server
+# side; payload bytes are the Plotly JSON specs sent for the page's charts, and
+# the client parse time is that of json.loads on them. Browser rendering is not
+# measured.
+import argparse
+import datetime
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'air-quality-dashboard.py')
+
+MEASURE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({script!r}, default_timeout=600)
+app.run()
+time.sleep({dwell})
+pages = {{}}
+for page in app.sidebar.radio[0].options:
+    start = time.perf_counter()
+    app.sidebar.radio[0].set_value(page).run()
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    app.run()
+    warm = time.perf_counter() - start
+    specs = [chart.proto.spec for chart in app.get('plotly_chart')]
+    start = time.perf_counter()
+    for spec in specs:
+        json.loads(spec)
+    parse = time.perf_counter() - start
+    pages[page] = [cold, warm, sum(len(spec.encode()) for spec in specs), len(specs), parse,
+                   [str(e.value) for e in app.exception]]
+print(json.dumps(pages))
+"""
+
+
+# The --csv copy is the data source, so the dashboard never fetches from the network
+def run(cwd, dwell=0):
+    env = dict(os.environ, DASHBOARD_DATA_SOURCE=os.path.join(cwd, 'data.csv'))
+    out = subprocess.run([sys.executable, '-c', MEASURE.format(script=SCRIPT, dwell=dwell)], cwd=cwd, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', required=True, help='path to the downloaded data.csv')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dwell', type=float, default=0, help='seconds on the first page before switching')
+    parser.add_argument('--record', help='append the results as a JSON line to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(args.csv, os.path.join(tmp, 'data.csv'))
+        run(tmp)  # builds the store
+        runs = [run(tmp, args.dwell) for _ in range(args.repeat)]
+
+    results = {}
+    print(f"{'Page':30s} {'first ms':>9s} {'repeat ms':>9s} {'charts':>6s} {'payload KB':>10s} {'parse ms':>8s}")
+    for page in runs[0]:
+        cold, warm, parse = (statistics.median(r[page][i] for r in runs) * 1000 for i in (0, 1, 4))
+        payload, charts, errors = runs[0][page][2], runs[0][page][3], runs[0][page][5]
+        results[page] = {'first_ms': round(cold, 1), 'repeat_ms': round(warm, 1), 'charts': charts,
+                         'payload_bytes': payload, 'parse_ms': round(parse, 2)}
+        print(f"{page:30s} {cold:9.1f} {warm:9.1f} {charts:6d} {payload / 1024:10.1f} {parse:8.2f}"
+              + (f"  raised: {errors[0]}" if errors else ''))
+
+    if args.record:
+        with open(args.record, 'a') as f:
+            f.write(json.dumps({'commit': commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                                'dwell': args.dwell, 'pages': results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# Peak RSS of loading + preprocessing: the original pipeline vs the compact one
+#
+# Usage: python benchmarks/preprocess_memory.py --csv data.csv
+# Each pipeline runs in a fresh interpreter. The cached value is pickled and
+# unpickled once, as st.cache_data does on every cache hit.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMON = """
+import pickle, resource
+import pandas as pd
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+baseline = rss_mb()
+"""
+
+# preprocess_data() as it was before the compact representation
+ORIGINAL = COMMON + """
+df = pd.read_csv({csv!r})
+df['date'] = pd.to_datetime(df[['year', 'month', 'day', 'hour']])
+df['day_of_week'] = df['date'].dt.day_name()
+df['hour_of_day'] = df['date'].dt.hour
+df['month_name'] = df['date'].dt.month_name()
+df['year_month'] = df['date'].dt.strftime('%Y-%m')
+dongsi_data = df[df['station'] == 'Dongsi'].copy()
+wanliu_data = df[df['station'] == 'Wanliu'].copy()
+result = pickle.loads(pickle.dumps((df, dongsi_data, wanliu_data)))
+print(baseline, rss_mb())
+"""
+
+COMPACT = COMMON + """
+from data_store import read_store
+from preprocessing import preprocess, station_slice
+df, ranges = pickle.loads(pickle.dumps(preprocess(read_store({store!r}))))
+dongsi_data = station_slice(df, ranges, 'Dongsi')
+wanliu_data = station_slice(df, ranges, 'Wanliu')
+print(baseline, rss_mb())
+"""
+
+
+def run(code, **paths):
+    out = subprocess.run([sys.executable, '-c', code.format(**paths)], cwd=ROOT,
+                         check=True, capture_output=True, text=True).stdout.split()
+    return float(out[0]), float(out[1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', required=True, help='path to the downloaded data.csv')
+    args = parser.parse_args()
+    csv = os.path.abspath(args.csv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = os.path.join(tmp, 'data.store')
+        subprocess.run([sys.executable, '-c',
+                        f"import pandas as pd; from data_store import compact_dtypes, create_store; "
+                        f"create_store({store!r}, compact_dtypes(pd.read_csv({csv!r})))"],
+                       cwd=ROOT, check=True)
+        results = {'original': run(ORIGINAL, csv=csv), 'compact': run(COMPACT, store=store)}
+
+    for name, (baseline, peak) in results.items():
+        print(f"{name:10s} peak RSS {peak:8.1f} MB  (imports {baseline:6.1f} MB, data {peak - baseline:8.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+# Benchmark suite: each pipeline stage and page computation at 1x / 10x / 100x scale
+#
+# Usage:
+#   python benchmarks/suite.py [--scales 1 10 100] [--years 4] [--repeat 3]
+#                              [--data-dir DIR] [--output results.json] [--compare old.json]
+#
+# Scale k is 12 * k synthetic stations over --years years (1x matches the real
+# dataset: 12 stations, 4 years, ~420k rows). Data come from synthetic_data.py
+# with a fixed seed, so runs on different commits measure the same input; with
+# --data-dir the generated CSVs are kept and reused. 100x needs several GB of
+# RAM and disk.
+#
+# Every stage runs in a fresh interpreter. Setup (imports, opening the dataset)
+# is not timed; the stage reports wall time and its peak memory above the RSS
+# at its start (Linux resets the peak through /proc/self/clear_refs; elsewhere
+# the process-wide peak is used). --output writes the medians as JSON and
+# --compare prints the ratio to an earlier result file, flagging regressions.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from synthetic_data import write_csv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import json, os, resource, sys, time
+sys.path.insert(0, {root!r})
+CSV, STORE = {csv!r}, {store!r}
+SELECTED = ['Dongsi', 'Wanliu']
+
+def memory_mb(field):
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field)) / 1024
+
+def reset_peak():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return memory_mb('VmRSS:')
+    except OSError:
+        return 0.0
+
+def peak_mb():
+    if os.path.exists('/proc/self/status'):
+        return memory_mb('VmHWM:')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 1024)
+
+{setup}
+before = reset_peak()
+start = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, peak_mb() - before]))
+"""
+
+# Opened out of core, like the dashboard
+DATASET = """
+import analytics
+from ingest import Dataset
+dataset = Dataset(STORE, in_memory=False)
+hourly_cube, daily_cube, moments = dataset.hourly_cube, dataset.daily_cube, dataset.moments
+stations = dataset.stations
+"""
+
+# name -> (setup, timed body). Page bodies make the analytics.py calls of the
+# dashboard pages with its default station selection.
+STAGES = {
+    'load_csv': ("""
+import pandas as pd
+from data_store import compact_dtypes
+""", """
+df = compact_dtypes(pd.read_csv(CSV))
+"""),
+    'build_store': ("""
+import pandas as pd, shutil
+from data_store import compact_dtypes, create_store
+shutil.rmtree(STORE, ignore_errors=True)
+""", """
+create_store(STORE, compact_dtypes(pd.read_csv(CSV)))
+"""),
+    'read_store': ("""
+from data_store import read_store
+""", """
+df = read_store(STORE)
+"""),
+    'query_store': ("""
+from data_store import read_manifest, read_store
+partition = read_manifest(STORE)['segments'][0]['partitions'][0]
+""", """
+df = read_store(STORE, ['PM10', 'TEMP'], stations=[partition['station']], years=[partition['year']])
+"""),
+    'preprocess': ("""
+from ingest import Dataset
+""", """
+dataset = Dataset(STORE)
+"""),
+    'preprocess_out_of_core': ("""
+import glob, os
+from ingest import Dataset
+for path in glob.glob(os.path.join(STORE, 'aggregates-*.pkl')):
+    os.remove(path)
+""", """
+dataset = Dataset(STORE, in_memory=False)
+"""),
+    # Later starts: from the aggregates persisted in the store
+    'open_out_of_core': ("""
+from ingest import Dataset
+Dataset(STORE, in_memory=False)
+""", """
+dataset = Dataset(STORE, in_memory=False)
+"""),
+    'daily_series': (DATASET + """
+from decomposition import daily_matrix
+""", """
+indexes, values = daily_matrix(daily_cube, stations)
+"""),
+    'page_overview': (DATASET, """
+analytics.describe(dataset, stations)
+analytics.record_counts(hourly_cube, stations)
+"""),
+    'page_daily_patterns': (DATASET, """
+analytics.hourly_profile(hourly_cube, SELECTED)
+analytics.hourly_profile(hourly_cube, SELECTED, years=hourly_cube.values('year')[:1])
+"""),
+    'page_correlations': (DATASET, """
+analytics.correlation_matrix(moments, SELECTED)
+for station in SELECTED:
+    analytics.correlation_matrix(moments, [station])
+analytics.scatter_density(dataset, 'TEMP', SELECTED)
+analytics.linear_fit(moments, SELECTED, 'TEMP')
+"""),
+    'page_annual': (DATASET, """
+analytics.yearly_means(hourly_cube, SELECTED)
+analytics.monthly_means(hourly_cube, SELECTED)
+rows = analytics.period_rows(dataset, SELECTED, columns=['year', 'station', 'PM10'])
+analytics.yearly_stats(hourly_cube, analytics.yearly_medians(rows), SELECTED)
+"""),
+    'page_distribution': (DATASET, """
+for column in ['PM10', 'TEMP']:
+    analytics.histogram(analytics.period_rows(dataset, SELECTED, columns=[column, 'station']), column)
+analytics.station_means(hourly_cube, SELECTED)
+analytics.box_stats(dataset, SELECTED)
+"""),
+    'page_further_analysis': (DATASET + """
+from decomposition import Decomposer
+""", """
+for station in SELECTED:
+    analytics.daily_series(daily_cube, station)
+decomposer = Decomposer(dataset)
+decomposer.decompose(SELECTED, 'Yearly cycle (365 d)')
+decomposer.decompose(SELECTED, 'Daily cycle (24 h)')
+"""),
+    'page_pollution_episodes': (DATASET + """
+import exposure
+""", """
+for window in exposure.WINDOWS.values():
+    episodes = exposure.station_episodes(dataset, stations, 'PM10', window, 150)
+    exposure.episode_summary(episodes, stations)
+    exposure.yearly_episode_counts(episodes)
+"""),
+    'lagged_correlation': (DATASET + """
+import lagcorr
+""", """
+results = lagcorr.station_correlations(dataset, SELECTED)
+for station in SELECTED:
+    lagcorr.peak_lags(results[station], 'PM10')
+"""),
+}
+
+
+def run_stage(name, csv, store):
+    setup, body = STAGES[name]
+    code = MEASURE.format(root=ROOT, csv=csv, store=store, setup=setup, body=body)
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def run_scale(scale, years, repeat, data_dir):
+    stations = 12 * scale
+    csv = os.path.join(data_dir, f'synthetic-{stations}x{years}.csv')
+    if not os.path.exists(csv):
+        write_csv(csv + '.tmp', stations=stations, years=years)
+        os.replace(csv + '.tmp', csv)
+    store = os.path.join(data_dir, f'synthetic-{stations}x{years}.store')
+
+    results = {}
+    for name in STAGES:
+        # build_store must finish before the stages that read the store
+        runs = [run_stage(name, csv, store) for _ in range(1 if name == 'build_store' else repeat)]
+        results[name] = {'seconds': statistics.median(t for t, _ in runs),
+                         'peak_mb': statistics.median(m for _, m in runs)}
+        print(f"{scale:>4}x  {name:24s} {results[name]['seconds']:9.3f} s  {results[name]['peak_mb']:9.1f} MB",
+              flush=True)
+    return {'stations': stations, 'years': years, 'csv_mb': os.path.getsize(csv) / 1e6, 'stages': results}
+
+
+def compare(results, path, threshold):
+    with open(path) as f:
+        old = json.load(f)
+    print(f"\nCompared with {path} (commit {old.get('commit')}): new / old")
+    for scale, current in results['scales'].items():
+        previous = old['scales'].get(scale)
+        if previous is None:
+            continue
+        for name, stage in current['stages'].items():
+            if name not in previous['stages']:
+                continue
+            ratios = [stage[m] / previous['stages'][name][m] if previous['stages'][name][m] > 0 else float('nan')
+                      for m in ('seconds', 'peak_mb')]
+            flag = '  REGRESSION' if any(r > 1 + threshold for r in ratios) else ''
+            print(f"{scale:>4}x  {name:24s} time {ratios[0]:6.2f}  memory {ratios[1]:6.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--years', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', help='keep generated data here and reuse it on later runs')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='results JSON of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown flagged as a regression')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        results = {'commit': commit(), 'python': platform.python_version(), 'machine': platform.machine(),
+                   'cpus': os.cpu_count(), 'scales': {}}
+        for scale in args.scales:
+            results['scales'][str(scale)] = run_scale(scale, args.years, args.repeat, os.path.abspath(data_dir))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
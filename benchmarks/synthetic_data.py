@@ -0,0 +1,113 @@
+# Deterministic synthetic hourly air quality data in the schema of data.csv
+#
+# Usage: python benchmarks/synthetic_data.py out.csv [--stations 12] [--years 4] [--seed 0]
+# Each station is generated independently from (seed, station number), so a
+# station's rows are identical whatever the number of stations or years
+# requested, and the CSV is written one station at a time. The series carry a
+# yearly and a two-peak daily cycle, meteorology correlated with PM10,
+# right-skewed pollutant levels and gaps of missing values.
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# The twelve stations of the real dataset; further stations are numbered
+STATIONS = ['Aotizhongxin', 'Changping', 'Dingling', 'Dongsi', 'Guanyuan', 'Gucheng',
+            'Huairou', 'Nongzhanguan', 'Shunyi', 'Tiantan', 'Wanliu', 'Wanshouxigong']
+WIND_DIRECTIONS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                   'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+START = '2013-03-01'
+
+
+def station_names(count):
+    return STATIONS[:count] + [f'Station{i + 1:04d}' for i in range(len(STATIONS), count)]
+
+
+# White noise smoothed over `hours` so consecutive hours are correlated
+def _smooth_noise(rng, n, hours):
+    kernel = np.exp(-np.arange(4 * hours) / hours)
+    kernel /= np.sqrt(np.sum(kernel ** 2))
+    return np.convolve(rng.standard_normal(n + len(kernel) - 1), kernel, mode='valid')
+
+
+# Blank out runs of hours (sensor outages) covering about `fraction` of the rows
+def _gaps(rng, n, fraction, mean_length=6):
+    missing = np.zeros(n, dtype=bool)
+    starts = rng.integers(0, n, int(n * fraction / mean_length) + 1)
+    lengths = rng.geometric(1 / mean_length, len(starts))
+    for start, length in zip(starts, lengths):
+        missing[start:start + length] = True
+    return missing
+
+
+def generate_station(number, name, years=4, seed=0, start=START):
+    rng = np.random.default_rng([seed, number])
+    dates = pd.date_range(start, pd.Timestamp(start) + pd.DateOffset(years=years), freq='h', inclusive='left')
+    n = len(dates)
+    day = 2 * np.pi * (dates.dayofyear.to_numpy() - 15) / 365.25
+    hour = dates.hour.to_numpy()
+
+    temp = 13 - 15 * np.cos(day) + 4 * np.sin(2 * np.pi * (hour - 9) / 24) + 3 * _smooth_noise(rng, n, 24)
+    dewp = temp - 9 - 5 * np.cos(day) + 4 * _smooth_noise(rng, n, 48)
+    pres = 1012 + 10 * np.cos(day) - 0.2 * (temp - 13) + 4 * _smooth_noise(rng, n, 72)
+    wspm = rng.gamma(2, 0.9, n) * (1 + 0.3 * np.sin(2 * np.pi * (hour - 14) / 24))
+
+    # Log PM10: station level, winter high, morning and evening peaks, cleared by wind
+    rush_hours = np.exp(-0.5 * ((hour - 8) / 1.5) ** 2) + np.exp(-0.5 * ((hour - 21) / 2) ** 2)
+    log_pm10 = (4.4 + rng.normal(0, 0.1) + 0.35 * np.cos(day) + 0.25 * rush_hours
+                - 0.15 * (wspm - 1.8) + 0.6 * _smooth_noise(rng, n, 36))
+    pm10 = np.exp(log_pm10)
+    pm25 = pm10 * np.clip(rng.normal(0.7, 0.1, n), 0.2, 1)
+
+    rain = np.where(rng.random(n) < 0.04 * (1 - np.cos(day)), rng.gamma(0.6, 2, n), 0.0)
+    frame = pd.DataFrame({
+        'No': np.arange(1, n + 1),
+        'year': dates.year, 'month': dates.month, 'day': dates.day, 'hour': hour,
+        'PM2.5': pm25,
+        'PM10': pm10,
+        'SO2': np.exp(2.3 + 0.8 * np.cos(day) + 0.5 * _smooth_noise(rng, n, 24)),
+        'NO2': np.exp(3.8 + 0.2 * rush_hours + 0.4 * _smooth_noise(rng, n, 12)),
+        'CO': np.exp(7 + 0.5 * np.cos(day) + 0.2 * rush_hours + 0.5 * _smooth_noise(rng, n, 24)),
+        'O3': np.maximum(0, 60 - 40 * np.cos(day) + 30 * np.sin(2 * np.pi * (hour - 9) / 24)
+                         + 15 * _smooth_noise(rng, n, 6)),
+        'TEMP': temp, 'PRES': pres, 'DEWP': np.minimum(dewp, temp), 'RAIN': rain,
+        'wd': np.asarray(WIND_DIRECTIONS)[rng.integers(0, len(WIND_DIRECTIONS), n)],
+        'WSPM': wspm,
+        'station': name,
+    })
+    for column, fraction in [('PM2.5', 0.02), ('PM10', 0.02), ('SO2', 0.02), ('NO2', 0.03),
+                             ('CO', 0.05), ('O3', 0.03), ('TEMP', 0.001), ('PRES', 0.001),
+                             ('DEWP', 0.001), ('RAIN', 0.001), ('WSPM', 0.001)]:
+        frame.loc[_gaps(rng, n, fraction), column] = np.nan
+    return frame.round(1)
+
+
+def generate(stations=12, years=4, seed=0, start=START):
+    return pd.concat([generate_station(i, name, years, seed, start) for i, name in enumerate(station_names(stations))],
+                     ignore_index=True)
+
+
+# Write the CSV one station at a time so memory stays at one station's rows
+def write_csv(path, stations=12, years=4, seed=0, start=START):
+    rows = 0
+    for i, name in enumerate(station_names(stations)):
+        frame = generate_station(i, name, years, seed, start)
+        frame.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        rows += len(frame)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output', help='CSV file to write')
+    parser.add_argument('--stations', type=int, default=12)
+    parser.add_argument('--years', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default=START, help='first hour, e.g. 2013-03-01')
+    args = parser.parse_args()
+    rows = write_csv(args.output, args.stations, args.years, args.seed, args.start)
+    print(f"Wrote {rows} rows for {args.stations} stations to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
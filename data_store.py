@@ -0,0 +1,235 @@
+# Columnar on-disk store for the air quality dataset
+#
+# The CSV is parsed once, converted to compact dtypes and written as
+# uncompressed Arrow IPC (Feather v2) files partitioned by station and year:
+# station=<name>/year=<year>/part-<segment>.arrow. Later starts memory-map the
+# files instead of downloading and re-parsing the CSV. New hourly batches are
+# added as further segments (see ingest.py); manifest.json lists the segments
+# and the partition files of each, so a query opens only the files of the
+# stations and years it asks for and reads only the columns it needs. The
+# aggregates of the latest version are kept next to the manifest
+# (aggregates-<created>-<version>.pkl, see ingest.Dataset), so opening the
+# store folds in only the segments appended since.
+import fcntl
+import glob
+import json
+import os
+import pickle
+import re
+import shutil
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+import pyarrow.fs as pafs
+
+# Explicit dtypes for the cleaned Beijing air quality data
+CATEGORY_COLUMNS = ['station', 'wd']
+SMALL_INT_COLUMNS = {'year': 'int16', 'month': 'int8', 'day': 'int8', 'hour': 'int8'}
+
+MANIFEST = 'manifest.json'
+# Partition keys, stored in the directory names rather than the files
+PARTITION_COLUMNS = ['station', 'year']
+_PARTITIONING = ds.partitioning(pa.schema([('station', pa.string()), ('year', pa.int16())]), flavor='hive')
+_FILESYSTEM = pafs.LocalFileSystem(use_mmap=True)
+
+
+# Exclusive lock held through a lock file, across processes
+class file_lock:
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, 'w')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+# Convert a freshly parsed frame to compact dtypes
+def compact_dtypes(df):
+    df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed:')])
+    dtypes = {}
+    for column in df.columns:
+        if column in SMALL_INT_COLUMNS:
+            dtypes[column] = SMALL_INT_COLUMNS[column]
+        elif column in CATEGORY_COLUMNS or df[column].dtype == object:
+            dtypes[column] = 'category'
+        elif pd.api.types.is_float_dtype(df[column]):
+            dtypes[column] = 'float32'
+        elif pd.api.types.is_integer_dtype(df[column]):
+            dtypes[column] = 'int32'
+    df = df.astype(dtypes)
+    # A 'date' column in the CSV is text, keep it as a real timestamp
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'].astype(str))
+    return df
+
+
+# Write a file atomically so a crashed write never leaves a partial file
+def _atomic_write(path, write):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(store):
+    with open(os.path.join(store, MANIFEST)) as f:
+        return json.load(f)
+
+
+def write_manifest(store, manifest):
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+    _atomic_write(os.path.join(store, MANIFEST), write)
+
+
+# Persist the aggregates of a manifest version and remove those of older versions
+def write_aggregates(store, manifest, aggregates):
+    created, version = manifest['created'], manifest['version']
+
+    def write(path):
+        with open(path, 'wb') as f:
+            pickle.dump(aggregates, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _atomic_write(os.path.join(store, f'aggregates-{created}-{version}.pkl'), write)
+    for path, (other_created, other_version) in _aggregate_files(store):
+        if other_created != created or other_version < version:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+# The latest persisted aggregates of the manifest's store at or before its
+# version, or None. Files that cannot be read (e.g. pickled by another pandas
+# version) are ignored, and the aggregates are rebuilt.
+def read_aggregates(store, manifest):
+    files = [(version, path) for path, (created, version) in _aggregate_files(store)
+             if created == manifest['created'] and version <= manifest['version']]
+    if not files:
+        return None
+    try:
+        with open(max(files)[1], 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+
+def _aggregate_files(store):
+    for path in glob.glob(os.path.join(store, 'aggregates-*.pkl')):
+        match = re.fullmatch(r'aggregates-(\w+)-(\d+)\.pkl', os.path.basename(path))
+        if match:
+            yield path, (match[1], int(match[2]))
+
+
+# Write one segment as a file per station x year partition, each sorted by
+# time; the rows are cast to the store schema when one is given. Returns the
+# manifest partition entries.
+def write_segment(store, name, df, schema=None):
+    order = np.lexsort([df[k].to_numpy() for k in ['hour', 'day', 'month']])
+    df = df.take(order)
+    table = pa.Table.from_pandas(df.drop(columns=PARTITION_COLUMNS), preserve_index=False)
+    if schema is not None:
+        arrays = [table.column(field.name).cast(field.type) if field.name in table.column_names
+                  else pa.nulls(len(table), field.type) for field in schema]
+        table = pa.Table.from_arrays(arrays, schema=schema)
+    groups = df.groupby([df['station'].astype(str).to_numpy(), df['year'].to_numpy()], sort=True).indices
+    partitions = []
+    for (station, year), rows in groups.items():
+        directory = os.path.join(f"station={quote(station, safe='')}", f'year={year}')
+        os.makedirs(os.path.join(store, directory), exist_ok=True)
+        part = table.take(rows)
+        path = os.path.join(directory, name)
+        _atomic_write(os.path.join(store, path),
+                      lambda tmp_path: feather.write_feather(part, tmp_path, compression='uncompressed'))
+        partitions.append({'station': station, 'year': int(year), 'path': path, 'rows': len(rows)})
+    return partitions
+
+
+def _file_schema(path):
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema
+
+
+# Schema of the stored columns (without the partition keys)
+def store_schema(store):
+    return _file_schema(os.path.join(store, read_manifest(store)['segments'][0]['partitions'][0]['path']))
+
+
+# Query the store: only the partition files of the given segments, stations and
+# years are opened, only the requested columns are read and `filter` (a
+# pyarrow.dataset expression) is applied during the scan. Files are
+# memory-mapped, so numeric columns without nulls are not copied. Rows come
+# grouped by station, in year and segment order.
+def read_store(store, columns=None, segments=None, stations=None, years=None, filter=None):
+    manifest = read_manifest(store)
+    stations = None if stations is None else set(stations)
+    years = None if years is None else {int(year) for year in years}
+    paths = [os.path.join(os.path.abspath(store), partition['path'])
+             for segment in manifest['segments'] if segments is None or segment['name'] in segments
+             for partition in segment['partitions']
+             if (stations is None or partition['station'] in stations) and (years is None or partition['year'] in years)]
+    paths.sort(key=lambda path: path.split(os.sep)[-3:])
+    schema = store_schema(store)
+    names = manifest['columns'] if columns is None else [c for c in manifest['columns'] if c in columns]
+    dataset = ds.dataset(paths, schema=pa.unify_schemas([schema, _PARTITIONING.schema]), format='ipc',
+                         partitioning=_PARTITIONING, partition_base_dir=os.path.abspath(store), filesystem=_FILESYSTEM)
+    df = dataset.to_table(columns=names, filter=filter).to_pandas(split_blocks=True)
+    if 'station' in df.columns:
+        df['station'] = df['station'].astype('category')
+    return df
+
+
+# Create a store holding df as its first segment; `source` identifies the file
+# it was built from (see ensure_store)
+def create_store(store, df, source=None):
+    os.makedirs(store, exist_ok=True)
+    partitions = write_segment(store, 'part-00000.arrow', df)
+    write_manifest(store, {
+        'created': os.urandom(4).hex(),
+        'version': 0,
+        'source': source,
+        'columns': list(df.columns),
+        'segments': [{'name': 'part-00000.arrow', 'rows': len(df), 'version': 0, 'partitions': partitions}],
+        'high_water_mark': high_water_marks(df),
+    })
+
+
+# Latest hourly timestamp per station, as ISO strings
+def high_water_marks(df):
+    dates = pd.to_datetime(df[['year', 'month', 'day', 'hour']])
+    latest = dates.groupby(df['station'].to_numpy()).max()
+    return {station: value.isoformat() for station, value in latest.items()}
+
+
+# Replace the store with one built from the CSV. The new store is built next
+# to the old one and swapped in with two renames.
+def _rebuild_store(csv_path, store, source):
+    new, old = f'{store}.new-{os.getpid()}', f'{store}.old-{os.getpid()}'
+    create_store(new, compact_dtypes(pd.read_csv(csv_path)), source)
+    os.rename(store, old)
+    os.rename(new, store)
+    shutil.rmtree(old)
+
+
+# Build the store from the CSV on first use. `source` identifies the contents
+# of the CSV (its SHA-256, see fetch.py): a store built from other contents is
+# rebuilt, which drops the batches appended to it since.
+def ensure_store(csv_path, store, source=None):
+    if not os.path.exists(os.path.join(store, MANIFEST)):
+        create_store(store, compact_dtypes(pd.read_csv(csv_path)), source)
+        return
+    if source is not None and read_manifest(store)['source'] != source:
+        _rebuild_store(csv_path, store, source)
+
+
+# Bytes held by a frame, including category labels
+def frame_nbytes(df):
+    return int(np.sum(df.memory_usage(deep=True).values))
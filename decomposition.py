@@ -0,0 +1,173 @@
+# Batched seasonal decomposition of station time series
+#
+# classical_decompose() reproduces statsmodels' additive seasonal_decompose
+# (centred moving-average trend, period-mean seasonal) for a whole
+# stations x time matrix at once with cumulative sums. STL has no batched
+# form and runs per station on a thread pool. Decomposer keeps reduced-
+# resolution components per (station, station version, period, method) in the
+# process-wide artifact cache, where they are evicted under its memory cap.
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+from parallel import map_stations
+
+# Selectable cycles: label -> (series frequency, period in samples)
+PERIODS = {
+    'Daily cycle (24 h)': ('h', 24),
+    'Weekly cycle (168 h)': ('h', 168),
+    'Yearly cycle (365 d)': ('D', 365),
+}
+COMPONENTS = ['original', 'trend', 'seasonal', 'residual']
+
+
+# Centred moving average along axis 1, NaN where the window is incomplete
+def _moving_average(values, period):
+    total = np.cumsum(np.pad(values, ((0, 0), (1, 0))), axis=1)
+    half = period // 2
+    trend = np.full(values.shape, np.nan)
+    if values.shape[1] <= 2 * half:
+        return trend
+    end = values.shape[1] - half
+    window = total[:, 2 * half + 1:] - total[:, :values.shape[1] - 2 * half]
+    if period % 2 == 0:
+        # Even periods use a 2 x period filter with half weights at both ends
+        window = window - 0.5 * (values[:, :end - half] + values[:, 2 * half:])
+    trend[:, half:end] = window / period
+    return trend
+
+
+# Additive classical decomposition of every row of a (stations x time) matrix
+def classical_decompose(values, period):
+    values = np.asarray(values, dtype='float64')
+    n_series, length = values.shape
+    trend = _moving_average(values, period)
+    detrended = values - trend
+
+    cycles = -(-length // period)
+    padded = np.full((n_series, cycles * period), np.nan)
+    padded[:, :length] = detrended
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        period_averages = np.nanmean(padded.reshape(n_series, cycles, period), axis=1)
+    period_averages -= period_averages.mean(axis=1, keepdims=True)
+    seasonal = np.tile(period_averages, cycles)[:, :length]
+    return {'original': values, 'trend': trend, 'seasonal': seasonal, 'residual': values - trend - seasonal}
+
+
+# STL with the default smoother lengths and R's stl() jumps (ceil(window / 10)):
+# the smoothers are evaluated at every jump-th point and interpolated, which
+# keeps hourly series with a weekly period tractable
+def _stl_one(args):
+    from statsmodels.tsa.seasonal import STL
+
+    series, period = args
+    seasonal = 7
+    trend = int(np.ceil(1.5 * period / (1 - 1.5 / seasonal))) | 1
+    low_pass = period + 1 + period % 2
+    result = STL(series, period=period, seasonal=seasonal, trend=trend, low_pass=low_pass,
+                 seasonal_jump=-(-seasonal // 10), trend_jump=-(-trend // 10),
+                 low_pass_jump=-(-low_pass // 10)).fit()
+    return {'original': series, 'trend': result.trend, 'seasonal': result.seasonal, 'residual': result.resid}
+
+
+# STL per row, spread over a thread pool. Rows may be NaN-padded on the right:
+# lengths gives the length of each row's series, and components stay NaN past it.
+def stl_decompose(values, period, lengths=None, workers=None):
+    values = np.asarray(values, dtype='float64')
+    lengths = [values.shape[1]] * len(values) if lengths is None else lengths
+    rows = {i: (row[:n], period) for i, (row, n) in enumerate(zip(values, lengths))}
+    results = map_stations(_stl_one, rows, workers=workers, threads=True)
+    parts = {c: np.full(values.shape, np.nan) for c in COMPONENTS}
+    for i, n in enumerate(lengths):
+        for c in COMPONENTS:
+            parts[c][i, :n] = results[i][c]
+    return parts
+
+
+# Mean of consecutive blocks so at most max_points remain along the time axis
+def downsample(index, values, max_points=1000):
+    step = max(1, -(-len(index) // max_points))
+    if step == 1:
+        return index, values
+    blocks = -(-len(index) // step)
+    padded = np.full(values.shape[:-1] + (blocks * step,), np.nan)
+    padded[..., :len(index)] = values
+    with warnings.catch_warnings():
+        # Blocks that fall entirely in the NaN edges of the trend stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        reduced = np.nanmean(padded.reshape(values.shape[:-1] + (blocks, step)), axis=-1)
+    return index[::step], reduced
+
+
+# Rows of one series per station, left-aligned and NaN-padded on the right:
+# (the dates of each station, stations x time values). Each station keeps its own
+# span, so its values do not depend on the other stations in the matrix.
+def _aligned(series):
+    indexes = [s.index for s in series]
+    values = np.full((len(series), max((len(i) for i in indexes), default=0)), np.nan)
+    for row, s in zip(values, series):
+        row[:len(s)] = s.to_numpy()
+    return indexes, values
+
+
+# Gap-free calendar over a station's own span, interior gaps interpolated
+def _fill(series, freq):
+    return series.asfreq(freq).interpolate(method='linear', limit_direction='both')
+
+
+# Daily means per station from the daily cube (see _aligned)
+def daily_matrix(daily_cube, stations, column='PM10'):
+    series = []
+    for station in stations:
+        daily = daily_cube.mean(column, ['year', 'month', 'day'], station=station)
+        dates = pd.to_datetime(daily.index.to_frame(index=False))
+        series.append(_fill(pd.Series(daily.values, index=dates).sort_index(), 'D'))
+    return _aligned(series)
+
+
+# Hourly values per station (rows sorted by date, see _aligned)
+def hourly_matrix(dataset, stations, column='PM10'):
+    series = []
+    for station in stations:
+        rows = dataset.rows([station], ['date', column])
+        series.append(_fill(pd.Series(rows[column].to_numpy(dtype='float64'), index=rows['date'].to_numpy()), 'h'))
+    return _aligned(series)
+
+
+class Decomposer:
+    def __init__(self, dataset, max_points=1000, cache=None):
+        self.dataset = dataset
+        self.max_points = max_points
+        self.cache = artifacts.CACHE if cache is None else cache
+
+    # {station: DataFrame(date, original, trend, seasonal, residual)} at reduced resolution,
+    # for the stations with at least two cycles of data. Stations missing from the cache are
+    # decomposed together in one batch, each over its own span.
+    def decompose(self, stations, period_label, method='classical', column='PM10'):
+        freq, period = PERIODS[period_label]
+        versions = {s: self.dataset.station_versions.get(s) for s in stations}
+        key = lambda s: ('decomposition', s, versions[s], column, freq, period, method, self.max_points)
+        results = {s: self.cache.lookup(key(s)) for s in stations}
+        missing = [s for s in stations if results[s] is None]
+        if missing:
+            if freq == 'D':
+                indexes, values = daily_matrix(self.dataset.daily_cube, missing, column)
+            else:
+                indexes, values = hourly_matrix(self.dataset, missing, column)
+            batch = [i for i, index in enumerate(indexes) if len(index) >= 2 * period]
+            lengths = [len(indexes[i]) for i in batch]
+            if batch:
+                values = values[batch][:, :max(lengths)]
+                # The NaN padding only reaches the moving averages of the padded hours
+                parts = (classical_decompose(values, period) if method == 'classical'
+                         else stl_decompose(values, period, lengths))
+                for row, (i, n) in enumerate(zip(batch, lengths)):
+                    reduced_index, reduced = downsample(indexes[i], np.stack([parts[c][row, :n] for c in COMPONENTS]),
+                                                        self.max_points)
+                    result = pd.DataFrame({c: reduced[j] for j, c in enumerate(COMPONENTS)})
+                    result.insert(0, 'date', reduced_index)
+                    results[missing[i]] = self.cache.put(key(missing[i]), result)
+        return {s: result for s, result in results.items() if result is not None}
@@ -0,0 +1,100 @@
+# Rolling exposure means and exceedance episodes of station time series
+#
+# rolling_means() puts one station's hourly values on a gap-free hourly grid
+# (hours missing from the record are missing values) and takes trailing
+# 24-hour or 8-hour means with cumulative sums. A window's mean needs at least
+# min_fraction of its hours, 75 % by default as in the usual 18-of-24 and
+# 6-of-8 hour rules; otherwise it is missing and breaks an episode. episodes()
+# finds the runs of hours whose rolling mean is above a limit by run-length
+# encoding the exceedance mask, and takes each run's peak with one
+# reduceat, so no step loops over hours. The hourly series come from
+# Dataset.rows(), which returns each station's rows sorted by time, and the
+# rolling means are kept per (station, station version, column, window) in the
+# process-wide artifact cache.
+import numpy as np
+import pandas as pd
+
+import artifacts
+
+# Selectable averaging windows: label -> hours
+WINDOWS = {'24-hour': 24, '8-hour': 8}
+POLLUTANTS = ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3']
+# Default limits (µg/m³) per column and window: the Grade II limits of China's
+# GB 3095-2012 (24-hour, and 8-hour for O3)
+LIMITS = {'PM2.5': {24: 75}, 'PM10': {24: 150}, 'SO2': {24: 150}, 'NO2': {24: 80}, 'CO': {24: 4000},
+          'O3': {8: 160}}
+
+
+# Default limit of a column for a window, the column's other limit when the window has none
+def default_limit(column, window):
+    limits = LIMITS.get(column, {})
+    return limits.get(window, next(iter(limits.values()), None))
+
+
+# Trailing rolling means on the hourly grid starting at the first date:
+# (first date, means), NaN where a window has too few values
+def rolling_means(dates, values, window, min_fraction=0.75):
+    if len(dates) == 0:
+        return np.datetime64('NaT', 'ns'), np.empty(0)
+    hours = (dates - dates[0]) // np.timedelta64(1, 'h')
+    grid = np.full(hours[-1] + 1, np.nan)
+    grid[hours] = values
+    valid = ~np.isnan(grid)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, grid, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    ends = np.arange(1, len(grid) + 1)
+    starts = np.maximum(ends - window, 0)
+    n = counts[ends] - counts[starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (sums[ends] - sums[starts]) / n
+    means[n < min_fraction * window] = np.nan
+    return dates[0], means
+
+
+# Runs of hours whose rolling mean is above the limit: start and end (last
+# hour) dates, duration in hours and peak rolling mean of each episode
+def episodes(first, means, limit):
+    above = np.concatenate(([False], means > limit, [False]))
+    edges = np.flatnonzero(above[1:] != above[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    # Between the end of a run and the next start every mean is at or below
+    # the limit (or missing, which fmax skips), so each reduceat segment peaks
+    # inside its run
+    peaks = np.fmax.reduceat(means, starts) if len(starts) else np.empty(0)
+    hour = np.timedelta64(1, 'h')
+    return pd.DataFrame({'start': first + starts * hour, 'end': first + (ends - 1) * hour,
+                         'duration': ends - starts, 'peak': peaks})
+
+
+# Rolling means of one station, cached per station version
+def station_rolling_means(dataset, station, column, window, min_fraction=0.75):
+    key = ('rolling_means', station, dataset.station_versions.get(station), column, window, min_fraction)
+
+    def compute():
+        rows = dataset.rows([station], ['date', column])
+        return rolling_means(rows['date'].to_numpy(), rows[column].to_numpy(dtype='float64'), window, min_fraction)
+    return artifacts.CACHE.get(key, compute)[0]
+
+
+# Exceedance episodes of the stations in one frame with a station column
+def station_episodes(dataset, stations, column, window, limit, min_fraction=0.75):
+    frames = [episodes(*station_rolling_means(dataset, station, column, window, min_fraction), limit)
+              .assign(station=station) for station in stations]
+    result = pd.concat(frames, ignore_index=True) if frames else episodes(*rolling_means([], [], window), limit)
+    return result.reindex(columns=['station', 'start', 'end', 'duration', 'peak'])
+
+
+# Per station: episode count, hours above the limit, mean and longest duration, peak
+def episode_summary(station_episodes, stations):
+    summary = station_episodes.groupby('station').agg(
+        episodes=('duration', 'size'), hours=('duration', 'sum'), mean_duration=('duration', 'mean'),
+        longest=('duration', 'max'), peak=('peak', 'max'))
+    summary = summary.reindex(list(stations))
+    summary[['episodes', 'hours', 'longest']] = summary[['episodes', 'hours', 'longest']].fillna(0).astype('int64')
+    return summary
+
+
+# Episode count per year (of the episode start) and station, in long format
+def yearly_episode_counts(station_episodes):
+    years = station_episodes['start'].dt.year.rename('year')
+    return station_episodes.groupby([years, 'station']).size().rename('episodes').reset_index()
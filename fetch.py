@@ -0,0 +1,189 @@
+# Fetching the dataset file: resumable, verified, atomic and conditional
+#
+# fetch(source, path) brings the file at path up to date with source, which is
+# an HTTP(S) URL (Google Drive share links included), a local file or a mirror
+# directory holding a file of the same name (for air-gapped deployments and
+# tests). The file is written to path + '.part' and renamed into place once its
+# SHA-256 is known to match (the expected digest, when one is given), so readers
+# never see a partial file. An interrupted HTTP download resumes from the
+# partial file with a Range request.
+#
+# path + '.meta.json' records the upstream version (ETag / Last-Modified, or the
+# size and mtime of a local source) and the digest. A later fetch sends a
+# conditional request and keeps the file while upstream has not changed. When
+# the server gives neither validator, the file is kept while a HEAD request
+# reports the same size, and downloaded again once older than MAX_AGE_SECONDS
+# (DATA_MAX_AGE_HOURS, default 24). Concurrent processes
+# take turns on path + '.lock', so exactly one downloads and the others find
+# the fresh file.
+#
+# Usage: python fetch.py SOURCE data.csv [--sha256 HEX]
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import urllib.parse
+import urllib.request
+from urllib.error import HTTPError
+
+from data_store import file_lock
+
+CHUNK_BYTES = 1 << 20
+MAX_AGE_SECONDS = float(os.environ.get('DATA_MAX_AGE_HOURS', 24)) * 3600
+
+
+def _read_meta(path):
+    try:
+        with open(path + '.meta.json') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(path, meta):
+    tmp_path = f"{path}.meta.json.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp_path, path + '.meta.json')
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Whether the file at path is the recorded copy of source (and has the expected digest)
+def _current(path, meta, source, sha256):
+    return (meta is not None and meta['source'] == source and os.path.exists(path)
+            and os.path.getsize(path) == meta['size'] and (sha256 is None or sha256.lower() == meta['sha256']))
+
+
+# Digest of a file so far, to continue hashing a resumed download
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest
+
+
+# Copy a stream into the file, updating the digest
+def _copy(stream, f, digest):
+    for chunk in iter(lambda: stream.read(CHUNK_BYTES), b''):
+        f.write(chunk)
+        digest.update(chunk)
+
+
+# Check the digest of the completed partial file and move it into place
+def _commit(part, path, digest, sha256, meta):
+    if sha256 is not None and digest.hexdigest() != sha256.lower():
+        _remove(part, part + '.meta.json')
+        raise ValueError(f"{meta['source']}: SHA-256 {digest.hexdigest()} does not match the expected {sha256}")
+    os.replace(part, path)
+    _write_meta(path, dict(meta, sha256=digest.hexdigest(), size=os.path.getsize(path), fetched=time.time()))
+    _remove(part + '.meta.json')
+    return digest.hexdigest()
+
+
+# Google Drive share links (uc?id=... or /file/d/<id>/...) -> the direct
+# download URL, past the confirmation page Drive shows for large files
+def _direct_url(url):
+    parsed = urllib.parse.urlparse(url)
+    if parsed.netloc != 'drive.google.com':
+        return url
+    match = re.search(r'/file/d/([^/]+)', parsed.path)
+    file_id = urllib.parse.parse_qs(parsed.query).get('id', [match and match.group(1)])[0]
+    if not file_id:
+        return url
+    return f'https://drive.usercontent.google.com/download?id={file_id}&export=download&confirm=t'
+
+
+# Whether a server without validators still reports the recorded size (when it
+# answers HEAD with a length at all)
+def _same_size(source, size):
+    try:
+        request = urllib.request.Request(_direct_url(source), method='HEAD')
+        with urllib.request.urlopen(request, timeout=60) as response:
+            length = response.headers.get('Content-Length')
+    except HTTPError:
+        return True
+    return length is None or int(length) == size
+
+
+def _fetch_url(source, path, sha256):
+    meta, part = _read_meta(path), path + '.part'
+    headers = {}
+    if _current(path, meta, source, sha256):
+        if not (meta.get('etag') or meta.get('last_modified')):
+            if time.time() - meta.get('fetched', 0) < MAX_AGE_SECONDS and _same_size(source, meta['size']):
+                return meta['sha256']
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    # Resume the partial download if the server still has the same version
+    partial = _read_meta(part)
+    offset = os.path.getsize(part) if partial is not None and os.path.exists(part) else 0
+    if offset and (partial.get('etag') or partial.get('last_modified')):
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = partial.get('etag') or partial['last_modified']
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(_direct_url(source), headers=headers), timeout=60)
+    except HTTPError as e:
+        if e.code == 304:
+            return meta['sha256']
+        if e.code == 416 and 'Range' in headers:
+            # The partial file is not a prefix of the current version
+            _remove(part, part + '.meta.json')
+            return _fetch_url(source, path, sha256)
+        raise
+    with response:
+        version = {'source': source, 'etag': response.headers.get('ETag'),
+                   'last_modified': response.headers.get('Last-Modified')}
+        resumed = response.status == 206
+        digest = _hash_file(part) if resumed else hashlib.sha256()
+        _write_meta(part, version)
+        with open(part, 'ab' if resumed else 'wb') as f:
+            _copy(response, f, digest)
+    return _commit(part, path, digest, sha256, version)
+
+
+# A local file, or the file of the same name in a mirror directory
+def _fetch_file(source, path, sha256):
+    meta, part = _read_meta(path), path + '.part'
+    local = urllib.request.url2pathname(urllib.parse.urlparse(source).path) if source.startswith('file:') else source
+    if os.path.isdir(local):
+        local = os.path.join(local, os.path.basename(path))
+    stat = os.stat(local)
+    version = {'source': source, 'mtime_ns': stat.st_mtime_ns, 'source_size': stat.st_size}
+    if _current(path, meta, source, sha256) and all(meta.get(k) == v for k, v in version.items()):
+        return meta['sha256']
+    digest = hashlib.sha256()
+    with open(local, 'rb') as src, open(part, 'wb') as f:
+        _copy(src, f, digest)
+    return _commit(part, path, digest, sha256, version)
+
+
+# Bring path up to date with source; returns the SHA-256 of the file
+def fetch(source, path, sha256=None):
+    with file_lock(path + '.lock'):
+        if urllib.parse.urlparse(source).scheme in ('http', 'https'):
+            return _fetch_url(source, path, sha256)
+        return _fetch_file(source, path, sha256)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='URL, local file or mirror directory')
+    parser.add_argument('path', help='where to keep the file, e.g. data.csv')
+    parser.add_argument('--sha256', help='expected SHA-256 of the file')
+    args = parser.parse_args()
+    print(fetch(args.source, args.path, args.sha256))
+
+
+if __name__ == '__main__':
+    main()
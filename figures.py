@@ -0,0 +1,224 @@
+# Plotly figures of the dashboard pages, built from the results of analytics.py
+#
+# Shared by the dashboard and the static reports (reports.py). Station traces
+# use the colours passed in `colors` ({station: colour}) so a station looks
+# the same on every figure. Large traces are drawn with WebGL, and series are
+# passed as NumPy arrays, which Plotly sends as base64 typed arrays rather
+# than JSON number lists; dates go as epoch milliseconds for the same reason.
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Traces with at least this many points are drawn with WebGL (Scattergl)
+WEBGL_POINTS = 1000
+
+
+# Line or marker trace with float32 values, on WebGL when large
+def _scatter(x, y, **kwargs):
+    trace = go.Scattergl if len(x) >= WEBGL_POINTS else go.Scatter
+    return trace(x=x, y=np.asarray(y, dtype='float32'), **kwargs)
+
+
+# Timestamps as milliseconds since the epoch, for a date axis (a float64 typed
+# array takes about half the bytes of ISO date strings)
+def _dates(values):
+    return np.asarray(values, dtype='datetime64[ms]').astype('float64')
+
+
+# One colour per station, stable for a given list of stations
+def station_colors(stations):
+    palette = px.colors.qualitative.Plotly + px.colors.qualitative.Dark24
+    return {name: palette[i % len(palette)] for i, name in enumerate(stations)}
+
+
+def station_pie(station_counts):
+    return px.pie(values=station_counts.values, names=station_counts.index, title="Data Distribution by Station")
+
+
+def count_bar(counts, label, title):
+    return px.bar(x=counts.index, y=counts.values, labels={'x': label, 'y': 'Count'}, title=title)
+
+
+# Hour-of-day profile, one line per station column
+def hourly_profile(profile, colors, title, y_title='Average PM10'):
+    fig = go.Figure()
+    for station_name in profile.columns:
+        fig.add_trace(go.Scatter(x=profile.index, y=profile[station_name],
+                                 mode='lines+markers', name=f'{station_name} Station',
+                                 line=dict(color=colors[station_name], width=2)))
+    fig.update_layout(
+        title=title,
+        xaxis_title='Hour of Day',
+        yaxis_title=y_title,
+        xaxis=dict(tickmode='linear', tick0=0, dtick=1),
+        legend=dict(y=0.99, x=0.99, xanchor='right', yanchor='top'),
+        hovermode='x unified'
+    )
+    return fig
+
+
+def correlation_heatmap(correlation, title):
+    fig = px.imshow(correlation,
+                    text_auto=True,
+                    color_continuous_scale='RdBu_r',
+                    labels=dict(color="Correlation"),
+                    zmin=-1, zmax=1)
+    fig.update_layout(title=title)
+    return fig
+
+
+# Binned density of (factor, PM10) with an optional point sample and the OLS trendline
+def scatter_density(counts, x_edges, y_edges, fit, factor, colors, samples=()):
+    slope, intercept, n = fit
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(x=x_centers, y=y_centers, z=np.where(counts.T > 0, counts.T, np.nan).astype('float32'),
+                             colorscale='Viridis', colorbar=dict(title='Count'), name='Density',
+                             hovertemplate=f'{factor}: %{{x:.1f}}<br>PM10: %{{y:.1f}}<br>Count: %{{z}}<extra></extra>'))
+    for station_name, station_points in samples:
+        fig.add_trace(_scatter(station_points[factor].to_numpy(dtype='float32'), station_points['PM10'],
+                               mode='markers', name=station_name, opacity=0.5,
+                               marker=dict(size=4, color=colors[station_name])))
+    fig.add_trace(go.Scatter(x=[x_edges[0], x_edges[-1]],
+                             y=[intercept + slope * x_edges[0], intercept + slope * x_edges[-1]],
+                             mode='lines', name=f'OLS trendline (slope {slope:.3f}, n={n})',
+                             line=dict(color='red', width=2)))
+    fig.update_layout(title=f'PM10 vs {factor} by Station',
+                      xaxis_title=factor, yaxis_title='PM10',
+                      legend=dict(y=0.99, x=0.01, xanchor='left', yanchor='top'))
+    return fig
+
+
+# Yearly or monthly means in long format, one line per station
+def trend_lines(means, x, colors, title, x_title, tick0):
+    fig = px.line(means, x=x, y='PM10', color='station',
+                  color_discrete_map=colors,
+                  markers=True, line_shape='linear',
+                  title=title,
+                  labels={'PM10': 'Average PM10', x: x_title})
+    fig.update_layout(
+        xaxis=dict(tickmode='linear', tick0=tick0, dtick=1),
+        legend=dict(y=0.99, x=0.01, xanchor='left', yanchor='top'),
+        hovermode='x unified'
+    )
+    return fig
+
+
+# Histogram from pre-binned counts: one overlaid series per station for a dict
+# of counts, a single series otherwise. `mean` adds a dashed red line and
+# `station_means` ({station: mean}) a dashed line per station.
+def histogram(edges, counts, title, x_label, colors=None, stations=(), mean=None, station_means=None):
+    centers = (edges[:-1] + edges[1:]) / 2
+    widths = np.diff(edges)
+    fig = go.Figure()
+    if isinstance(counts, dict):
+        for station_name in stations:
+            fig.add_trace(go.Bar(x=centers, y=counts.get(station_name, 0 * centers), width=widths, name=station_name,
+                                 opacity=0.7, marker_color=colors[station_name]))
+    else:
+        fig.add_trace(go.Bar(x=centers, y=counts, width=widths, name=x_label))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title='Frequency',
+                      barmode='overlay', bargap=0)
+
+    if mean is not None:
+        fig.add_vline(x=mean, line_dash="dash", line_color="red")
+        fig.add_annotation(x=mean, y=0.9, yref="paper",
+                           text=f"Mean: {mean:.2f}",
+                           showarrow=True, arrowhead=1)
+    for i, (station_name, station_mean) in enumerate((station_means or {}).items()):
+        color = colors[station_name]
+        fig.add_vline(x=station_mean, line_dash="dash", line_color=color)
+        fig.add_annotation(x=station_mean, y=0.95 - 0.1 * (i % 8), yref="paper",
+                           text=f"{station_name} Mean: {station_mean:.2f}",
+                           showarrow=True, arrowhead=1, font=dict(color=color))
+    return fig
+
+
+# Box plots from sketch statistics: {station: (years, stats)}
+def box_plots(boxes, colors):
+    fig = go.Figure()
+    for station_name, (years, stats) in boxes.items():
+        fig.add_trace(go.Box(x=years, name=station_name, marker_color=colors[station_name],
+                             **{field: [s[field] for s in stats] for field in stats[0]}))
+    fig.update_layout(title='PM10 Distribution by Year and Station', boxmode='group',
+                      xaxis_title='Year', yaxis_title='PM10 Concentration')
+    return fig
+
+
+# Daily means: {station: frame with date and PM10}
+def daily_lines(daily, colors):
+    fig = go.Figure()
+    for station_name, daily_station_data in daily.items():
+        fig.add_trace(_scatter(_dates(daily_station_data['date']), daily_station_data['PM10'], mode='lines',
+                               name=station_name, line=dict(color=colors[station_name])))
+    fig.update_layout(title='Daily Average PM10 Concentrations', xaxis_title='Date', yaxis_title='PM10 Concentration',
+                      xaxis_type='date')
+    return fig
+
+
+# Decomposition components, one panel each with a shared date axis
+def decomposition(decompositions, colors, title):
+    from plotly.subplots import make_subplots
+    from decomposition import COMPONENTS
+
+    titles = ['Original Data', 'Trend Component', 'Seasonal Component', 'Residual Component']
+    fig = make_subplots(rows=len(COMPONENTS), cols=1, shared_xaxes=True, subplot_titles=titles,
+                        vertical_spacing=0.05)
+    for row, component in enumerate(COMPONENTS, start=1):
+        for station_name, decomp_data in decompositions.items():
+            fig.add_trace(_scatter(_dates(decomp_data['date']), decomp_data[component], mode='lines',
+                                   name=station_name, legendgroup=station_name, showlegend=row == 1,
+                                   line=dict(color=colors[station_name])), row=row, col=1)
+    fig.update_layout(height=900, title=title)
+    fig.update_xaxes(type='date')
+    fig.update_xaxes(title_text='Date', row=len(COMPONENTS), col=1)
+    return fig
+
+
+# Exceedance episodes per year, grouped bars per station (long format: year, station, episodes)
+def episode_counts(counts, colors, title):
+    fig = px.bar(counts, x='year', y='episodes', color='station', barmode='group',
+                 color_discrete_map=colors, title=title,
+                 labels={'year': 'Year', 'episodes': 'Episodes'})
+    fig.update_layout(xaxis=dict(tickmode='linear', dtick=1))
+    return fig
+
+
+# One marker per episode at its start date and duration, with the peak on hover
+def episode_timeline(episodes, colors, title, peak_label):
+    fig = go.Figure()
+    for station_name, station_episodes in episodes.groupby('station', sort=False):
+        fig.add_trace(_scatter(_dates(station_episodes['start']), station_episodes['duration'], mode='markers',
+                               name=station_name, marker=dict(size=6, color=colors[station_name], opacity=0.7),
+                               customdata=station_episodes['peak'].to_numpy(dtype='float32'),
+                               hovertemplate=f'%{{x}}<br>%{{y}} h<br>{peak_label}: %{{customdata:.1f}}'))
+    fig.update_layout(title=title, xaxis_title='Episode start', yaxis_title='Duration (hours)', xaxis_type='date')
+    return fig
+
+
+# Correlation of each column with the target following it by each lag (columns x lags)
+def lag_heatmap(lags, columns, correlations, target, title):
+    fig = go.Figure(go.Heatmap(x=lags, y=columns, z=np.asarray(correlations, dtype='float32'),
+                               colorscale='RdBu_r', zmin=-1, zmax=1, colorbar=dict(title='Correlation'),
+                               hovertemplate=f'%{{y}} at t, {target} at t + %{{x}} h: %{{z:.3f}}<extra></extra>'))
+    fig.update_layout(title=title, xaxis_title=f'Lag (hours {target} follows)', yaxis_title='Variable')
+    return fig
+
+
+# Correlation against lag, one line per column, with a marker at the strongest correlation
+def lag_curves(lags, curves, target, title):
+    palette = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, (column, curve) in enumerate(curves.items()):
+        color = palette[i % len(palette)]
+        fig.add_trace(_scatter(lags, curve, mode='lines', name=column, legendgroup=column, line=dict(color=color)))
+        if not np.isnan(curve).all():
+            peak = np.nanargmax(np.abs(curve))
+            fig.add_trace(go.Scatter(x=[lags[peak]], y=[curve[peak]], mode='markers', name=f'{column} peak',
+                                     legendgroup=column, showlegend=False, marker=dict(size=9, color=color)))
+    fig.add_vline(x=0, line_dash='dash', line_color='grey')
+    fig.update_layout(title=title, xaxis_title=f'Lag (hours {target} follows)', yaxis_title='Correlation',
+                      yaxis=dict(range=[-1, 1]), hovermode='x unified')
+    return fig
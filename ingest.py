@@ -0,0 +1,377 @@
+# Incremental ingestion of new hourly records
+#
+# append_batch() adds a batch of hourly rows to the store as a new segment,
+# without touching the existing segments. Dataset keeps the aggregates (and,
+# unless opened out of core, the preprocessed frame) in memory and folds in
+# only the segments it has not seen. It also persists the aggregates in the
+# store, so a later out-of-core open starts from them and reads only the
+# segments appended since.
+#
+# Usage:
+#   python ingest.py data.store new_rows.csv [more.csv ...]
+#   python ingest.py data.store --watch incoming/ [--interval 10]
+import argparse
+import glob
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+import artifacts
+from aggregates import (AggregateCube, HOURLY_KEYS, DAILY_KEYS, MEASUREMENT_COLUMNS, partition_moments,
+                        quantile_sketches, merge_partitions)
+from data_store import (compact_dtypes, read_manifest, write_manifest, write_segment, store_schema, read_store,
+                        high_water_marks, file_lock, read_aggregates, write_aggregates)
+from parallel import map_stations
+from preprocessing import add_time_columns, sort_by_station, append_rows, concat_frames, station_slice, date_slice
+
+# Stored columns the derived time columns are computed from
+TIME_KEYS = ['year', 'month', 'day', 'hour']
+# Rows of a station's year partitions read and aggregated together (a larger year is read on its own)
+BATCH_ROWS = 1_000_000
+
+
+# Append a batch of hourly records to the store and return the rows kept.
+# Rows are deduplicated on (station, datetime): within the batch the last row
+# wins, and rows at or before the station's high-water mark are already stored.
+def append_batch(store, batch):
+    batch = compact_dtypes(batch)
+    stations = batch['station'].astype(str).to_numpy()
+    dates = pd.to_datetime(batch[['year', 'month', 'day', 'hour']]).to_numpy()
+
+    # Concurrent writers take turns so appends never interleave
+    with file_lock(os.path.join(store, 'ingest.lock')):
+        manifest = read_manifest(store)
+        marks = pd.to_datetime(pd.Series(stations).map(manifest['high_water_mark'])).to_numpy()
+        keep = ~pd.DataFrame({'station': stations, 'date': dates}).duplicated(keep='last').to_numpy()
+        keep &= ~(dates <= marks)
+        batch = batch[keep].reset_index(drop=True)
+        if batch.empty:
+            return batch
+
+        version = manifest['version'] + 1
+        name = f'part-{version:05d}.arrow'
+        partitions = write_segment(store, name, batch, store_schema(store))
+
+        manifest['segments'].append({'name': name, 'rows': len(batch), 'version': version, 'partitions': partitions})
+        manifest['version'] = version
+        for station, mark in high_water_marks(batch).items():
+            manifest['high_water_mark'][station] = max(mark, manifest['high_water_mark'].get(station, mark))
+        write_manifest(store, manifest)
+    return batch
+
+
+# Append every CSV dropped into a directory, then move it to processed/
+def ingest_directory(store, drop_dir):
+    processed = os.path.join(drop_dir, 'processed')
+    os.makedirs(processed, exist_ok=True)
+    added = 0
+    for path in sorted(glob.glob(os.path.join(drop_dir, '*.csv'))):
+        added += len(append_batch(store, pd.read_csv(path)))
+        shutil.move(path, os.path.join(processed, os.path.basename(path)))
+    return added
+
+
+def watch_directory(store, drop_dir, interval=10):
+    while True:
+        added = ingest_directory(store, drop_dir)
+        if added:
+            print(f"Appended {added} rows")
+        time.sleep(interval)
+
+
+# Preprocess one station's rows of some segments and build its aggregates and
+# the quantile sketches in use (runs in a worker process, which reads the rows
+# from the store itself). The rows are read and aggregated a batch of year
+# partitions at a time (see _year_batches); every aggregate is keyed by year, so
+# the batches' cubes hold disjoint cells and are returned as lists for the
+# caller to concatenate once. The rows are returned only when kept in memory.
+def _prepare_station(args):
+    store, segments, station, batches, keep_rows, sketch_keys = args
+    frames, hourly, daily, moments, sketches = [], [], [], {}, {key: {} for key in sketch_keys}
+    for years in batches:
+        rows = add_time_columns(read_store(store, segments=segments, stations=[station], years=years))
+        hourly.append(AggregateCube.build(rows, HOURLY_KEYS))
+        daily.append(AggregateCube.build(rows, DAILY_KEYS))
+        moments.update(partition_moments(rows, workers=1))
+        for key in sketch_keys:
+            sketches[key].update(quantile_sketches(rows, key[0], relative_accuracy=key[1]))
+        if keep_rows:
+            frames.append(rows)
+    return concat_frames(frames) if keep_rows else None, hourly, daily, moments, sketches
+
+
+# Consecutive years in batches of at most max_rows rows, from {year: rows}
+def _year_batches(year_rows, max_rows):
+    batches, total = [], 0
+    for year, rows in sorted(year_rows.items()):
+        if batches and total + rows <= max_rows:
+            batches[-1].append(year)
+            total += rows
+        else:
+            batches.append([year])
+            total = rows
+    return batches
+
+
+# Aggregates of a store, and optionally its preprocessed frame, kept current
+# incrementally. Stations are preprocessed and aggregated in parallel across
+# `workers` processes. With in_memory=False the hourly rows stay on disk: the
+# aggregates are built from a bounded batch of one station's year partitions at
+# a time (BATCH_ROWS) and rows() reads only the partitions and columns asked
+# for, so memory does not grow with the archive.
+class Dataset:
+    def __init__(self, store, workers=None, in_memory=True):
+        self.store = store
+        self.workers = workers
+        self.in_memory = in_memory
+        self.version = None
+        self.columns = []
+        self.row_count = 0
+        self.frame = None
+        self.ranges = {}
+        self.hourly_cube = None
+        self.daily_cube = None
+        self.moments = {}
+        self.station_versions = {}
+        self._sketches = {}
+        self._sketch_lock = threading.Lock()
+        self._segments = []
+        self._lock = threading.Lock()
+        self.refresh()
+
+    # Fold in segments appended since the last refresh; returns the affected stations
+    def refresh(self):
+        with self._lock:
+            manifest = read_manifest(self.store)
+            version = f"{manifest['created']}-{manifest['version']}"
+            if version == self.version:
+                return []
+            if self.version is not None and not self.version.startswith(f"{manifest['created']}-"):
+                # The store was rebuilt from scratch
+                self.frame = self.hourly_cube = None
+                self.row_count = 0
+                self._segments = []
+            self.columns = manifest['columns']
+            new = [s for s in manifest['segments'] if s['name'] not in self._segments]
+            if new and self.hourly_cube is None and not self.in_memory:
+                self._restore(manifest)
+                new = [s for s in new if s['name'] not in self._segments]
+            affected = []
+            if new:
+                affected = self._apply(new, version)
+                self._segments = self._segments + [s['name'] for s in new]
+                self.row_count += sum(s['rows'] for s in new)
+                write_aggregates(self.store, manifest, {
+                    'columns': self.columns, 'segments': self._segments, 'station_versions': self.station_versions,
+                    'hourly': self.hourly_cube, 'daily': self.daily_cube, 'moments': self.moments})
+            self.version = version
+            return affected
+
+    # Start from the aggregates persisted for an earlier version of the store, if any
+    def _restore(self, manifest):
+        saved = read_aggregates(self.store, manifest)
+        segments = {s['name']: s['rows'] for s in manifest['segments']}
+        if saved is None or saved['columns'] != manifest['columns'] or not set(saved['segments']) <= set(segments):
+            return
+        self.hourly_cube, self.daily_cube, self.moments = saved['hourly'], saved['daily'], saved['moments']
+        self.station_versions = dict(saved['station_versions'])
+        self._segments = list(saved['segments'])
+        self.row_count = sum(segments[name] for name in self._segments)
+
+    def _apply(self, segments, version):
+        names = [s['name'] for s in segments]
+        year_rows = {}
+        for partition in (p for s in segments for p in s['partitions']):
+            station_years = year_rows.setdefault(partition['station'], {})
+            station_years[partition['year']] = station_years.get(partition['year'], 0) + partition['rows']
+        affected = sorted(year_rows)
+        first = self.hourly_cube is None
+        sketch_keys = [] if first else list(self._sketches)
+        items = {station: (self.store, names, station, _year_batches(year_rows[station], BATCH_ROWS), self.in_memory,
+                           sketch_keys) for station in affected}
+        prepared = map_stations(_prepare_station, items, workers=self.workers)
+        frames, hourly, daily, moments, sketches = zip(*prepared.values())
+        hourly = AggregateCube.concat([cube for cubes in hourly for cube in cubes])
+        daily = AggregateCube.concat([cube for cubes in daily for cube in cubes])
+        moments = {key: value for station_moments in moments for key, value in station_moments.items()}
+        if first:
+            if self.in_memory:
+                self.frame, self.ranges = sort_by_station(concat_frames(frames))
+            self.hourly_cube, self.daily_cube, self.moments = hourly, daily, moments
+            self._sketches = {}
+        else:
+            if self.in_memory:
+                self.frame, self.ranges = append_rows(self.frame, self.ranges, concat_frames(frames))
+            self.hourly_cube = self.hourly_cube.merge(hourly)
+            self.daily_cube = self.daily_cube.merge(daily)
+            self.moments = merge_partitions(self.moments, moments)
+            for key in sketch_keys:
+                new = {k: v for station_sketches in sketches for k, v in station_sketches[key].items()}
+                self._sketches[key] = merge_partitions(self._sketches[key], new)
+        for station in affected:
+            self.station_versions[station] = version
+        return affected
+
+    @property
+    def stations(self):
+        return self.hourly_cube.values('station')
+
+    # Preprocessed rows of the stations (each sorted by date), optionally only
+    # some columns, some years and a date range [start, stop). In memory these
+    # are slices of the frame, the date range found by binary search; out of
+    # core only the matching partitions and columns are read from the store, and
+    # kept in the shared artifact cache unless cache is False.
+    def rows(self, stations, columns=None, years=None, dates=None, cache=True):
+        frames = []
+        for station in stations:
+            if self.frame is not None:
+                rows = station_slice(self.frame, self.ranges, station)
+                if dates is not None:
+                    rows = date_slice(rows, *dates)
+                if years is not None:
+                    rows = rows[rows['year'].isin(years).to_numpy()]
+            elif not cache:
+                rows = self._read(station, columns, years, dates)
+            else:
+                # Reads are kept in the shared artifact cache as per-station slices, keyed
+                # by the station's version so appends to other stations keep them
+                key = ('rows', self.store, self.station_versions.get(station), station, None if columns is None else tuple(columns),
+                       None if years is None else tuple(years), dates)
+                rows = artifacts.CACHE.get(key, lambda: self._read(station, columns, years, dates))[0]
+            frames.append(rows if columns is None else rows[list(columns)])
+        return concat_frames(frames) if len(frames) > 1 else frames[0]
+
+    def _read(self, station, columns, years, dates):
+        if dates is not None:
+            # Only the partitions of the years the range touches
+            touched = range(dates[0].year, (dates[1] - pd.Timedelta(1)).year + 1)
+            years = [year for year in touched if years is None or year in years]
+        derived = columns is None or dates is not None or any(c not in self.columns for c in columns)
+        read = None if columns is None else list(columns) + [k for k in TIME_KEYS if derived and k not in columns]
+        rows = read_store(self.store, read, self._segments, [station], years)
+        if derived:
+            rows = add_time_columns(rows)
+        return rows if dates is None else date_slice(rows, *dates)
+
+    # Rows of every station in some months ((year, month) pairs), within the date
+    # range [start, stop); one scan with the months pushed down as a filter
+    def month_rows(self, months, columns, dates):
+        condition = None
+        for year, month in months:
+            match = (ds.field('year') == year) & (ds.field('month') == month)
+            condition = match if condition is None else condition | match
+        read = list(columns) + [k for k in TIME_KEYS if k not in columns]
+        rows = add_time_columns(read_store(self.store, read, self._segments, years={y for y, _ in months},
+                                           filter=condition))
+        return rows[((rows['date'] >= dates[0]) & (rows['date'] < dates[1])).to_numpy()]
+
+    # First and last day with records
+    def date_span(self):
+        days = self.daily_cube.rows.index.droplevel('station').unique()
+        dates = pd.to_datetime(days.to_frame(index=False))
+        return dates.min(), dates.max()
+
+    # First rows of the preprocessed data (the first station's first year)
+    def head(self, n=5):
+        if self.frame is not None:
+            return self.frame.head(n)
+        station = self.stations[0]
+        return self.rows([station], years=self.hourly_cube.count(['year'], station=station).index[:1]).head(n)
+
+    # Quantile sketches per station x year, built on first use and then merged on
+    # refresh; concurrent callers wait for a single build
+    def sketches(self, column, relative_accuracy):
+        key = (column, relative_accuracy)
+        with self._sketch_lock:
+            if key not in self._sketches:
+                if self.frame is not None:
+                    self._sketches[key] = quantile_sketches(self.frame, column, relative_accuracy=relative_accuracy)
+                else:
+                    sketches = {}
+                    for station in self.stations:
+                        rows = self.rows([station], [column, 'station', 'year'])
+                        sketches.update(quantile_sketches(rows, column, relative_accuracy=relative_accuracy))
+                    self._sketches[key] = sketches
+            return self._sketches[key]
+
+
+# The cells of a cube keyed by year and month in the given months (year * 12 + month - 1)
+def _month_cells(cube, months):
+    def select(frame):
+        index = frame.index
+        month = index.get_level_values('year').astype('int64') * 12 + index.get_level_values('month').astype('int64') - 1
+        return frame[np.isin(month, months)]
+    return AggregateCube({name: select(frame) for name, frame in cube.stats.items()}, select(cube.rows), cube.keys)
+
+
+# The rows of a Dataset within a date range [start, stop), with the attributes
+# and methods the pages use. Its hourly and daily cubes and moments have cells
+# per month or finer, so the months wholly inside the range are taken from the
+# dataset's; only the rows of the (at most two) months the range cuts are read,
+# for all stations in one filtered scan, and aggregated. The cost follows the
+# number of months and stations rather than the rows of the range.
+class DateRangeView:
+    def __init__(self, dataset, start, stop):
+        self.dataset = dataset
+        self.dates = (pd.Timestamp(start), pd.Timestamp(stop))
+        span = f"{self.dates[0]:%Y%m%d}-{self.dates[1]:%Y%m%d}"
+        self.version = f"{dataset.version}:{span}"
+        self.columns = dataset.columns
+        self.frame = None
+        self._sketches = {}
+        self._sketch_lock = threading.Lock()
+        start, stop = self.dates
+        last = stop - pd.Timedelta(1)
+        month_start = lambda month: pd.Timestamp(year=month // 12, month=month % 12 + 1, day=1)
+        months = range(start.year * 12 + start.month - 1, last.year * 12 + last.month)
+        inside = [m for m in months if month_start(m) >= start and month_start(m + 1) <= stop]
+        cut = [(m // 12, m % 12 + 1) for m in months if m not in inside]
+
+        hourly, daily = [_month_cells(dataset.hourly_cube, inside)], [_month_cells(dataset.daily_cube, inside)]
+        self.moments = {key: value for key, value in dataset.moments.items() if key[1] * 12 + key[2] - 1 in inside}
+        if cut:
+            columns = ['station'] + TIME_KEYS + [c for c in MEASUREMENT_COLUMNS if c in dataset.columns]
+            rows = dataset.month_rows(cut, columns, self.dates)
+            hourly.append(AggregateCube.build(rows, HOURLY_KEYS))
+            daily.append(AggregateCube.build(rows, DAILY_KEYS))
+            self.moments.update(partition_moments(rows, workers=1))
+        hourly, daily = [c for c in hourly if len(c.rows)], [c for c in daily if len(c.rows)]
+        self.row_count = int(sum(cube.rows.sum() for cube in hourly))
+        if not self.row_count:
+            raise ValueError(f"no records between {start:%Y-%m-%d} and {stop:%Y-%m-%d}")
+        self.hourly_cube, self.daily_cube = AggregateCube.concat(hourly), AggregateCube.concat(daily)
+        self.station_versions = {station: f"{version}:{span}" for station, version in dataset.station_versions.items()}
+
+    stations = Dataset.stations
+    head = Dataset.head
+    date_span = Dataset.date_span
+    # Sketches are built station by station from the rows of the range
+    sketches = Dataset.sketches
+
+    def rows(self, stations, columns=None, years=None, dates=None, cache=True):
+        if dates is not None:
+            dates = (max(dates[0], self.dates[0]), min(dates[1], self.dates[1]))
+        return self.dataset.rows(stations, columns, years, dates or self.dates, cache)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', help='store directory, e.g. data.store')
+    parser.add_argument('batches', nargs='*', help='CSV files of new hourly records')
+    parser.add_argument('--watch', help='directory to poll for new CSV batches')
+    parser.add_argument('--interval', type=float, default=10, help='polling interval in seconds')
+    args = parser.parse_args()
+
+    for path in args.batches:
+        print(f"{path}: appended {len(append_batch(args.store, pd.read_csv(path)))} rows")
+    if args.watch:
+        watch_directory(args.store, args.watch, args.interval)
+
+
+if __name__ == '__main__':
+    main()
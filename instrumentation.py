@@ -0,0 +1,251 @@
+# Opt-in timing and memory instrumentation for the dashboard
+#
+# Enabled by setting DASHBOARD_PROFILE=1 before starting Streamlit. Each rerun
+# then records, per stage (data loading, preprocessing, the page branch and
+# every chart): wall time, peak traced allocations (tracemalloc; the peak is
+# process-wide, so concurrent sessions count in each other's), the Plotly
+# payload size and the hits/misses of the Streamlit caches. Records are shown
+# in a sidebar panel and logged as JSON lines on the 'dashboard.profile'
+# logger. With DASHBOARD_PROFILE_METRICS=path, process-wide totals are also
+# written there in the Prometheus text format (for a textfile collector).
+# Modules with counters of their own (e.g. the shared artifact cache) publish
+# them with register_stats(); they appear in the panel and the metrics.
+#
+# When disabled, start_run() returns a profiler whose methods do nothing and
+# cached()/chart() hand back the Streamlit functions unchanged, so the
+# dashboard runs exactly the code it would without instrumentation.
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+ENABLED = os.environ.get('DASHBOARD_PROFILE', '') not in ('', '0')
+METRICS_PATH = os.environ.get('DASHBOARD_PROFILE_METRICS')
+
+log = logging.getLogger('dashboard.profile')
+
+# Process-wide totals: stage -> [calls, seconds, max seconds, payload bytes],
+# cache name -> [hits, misses]
+_stage_totals = {}
+_cache_totals = {}
+# name -> function returning {counter: value}
+_stats_providers = {}
+_totals_lock = threading.Lock()
+# Profiler of the rerun executing on this thread (each session runs its own script thread)
+_local = threading.local()
+
+if ENABLED:
+    tracemalloc.start()
+    if not log.handlers:
+        log.addHandler(logging.StreamHandler())
+        log.setLevel(logging.INFO)
+
+
+class _Frame:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.start = time.perf_counter()
+        self.child_peak = 0
+        tracemalloc.reset_peak()
+        self.base = tracemalloc.get_traced_memory()[0]
+
+
+class Profiler:
+    def __init__(self, session=None):
+        self.session = session
+        self.records = []
+        self.cache_events = []
+        self._stack = []
+        self._mark = time.perf_counter()
+        self._run = self.start('run')
+        _local.profiler = self
+
+    def start(self, name, **fields):
+        # tracemalloc keeps a single peak, so the enclosing stage's peak so far is
+        # saved before the new stage resets it, and nested stages pass theirs up
+        if self._stack:
+            self._stack[-1].child_peak = max(self._stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+        frame = _Frame(name, fields)
+        self._stack.append(frame)
+        return frame
+
+    # Close a stage started with start(); returns its record
+    def stop(self, frame, **fields):
+        seconds = time.perf_counter() - frame.start
+        peak = max(tracemalloc.get_traced_memory()[1], frame.child_peak)
+        while self._stack and self._stack.pop() is not frame:
+            pass
+        if self._stack:
+            self._stack[-1].child_peak = max(self._stack[-1].child_peak, peak)
+        record = {'stage': frame.name, 'seconds': seconds, 'alloc_peak_bytes': max(0, peak - frame.base),
+                  **frame.fields, **fields}
+        self._record(record)
+        self._mark = time.perf_counter()
+        return record
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        frame = self.start(name, **fields)
+        try:
+            yield frame
+        finally:
+            self.stop(frame)
+
+    def _record(self, record):
+        self.records.append(record)
+        with _totals_lock:
+            totals = _stage_totals.setdefault(record['stage'], [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += record['seconds']
+            totals[2] = max(totals[2], record['seconds'])
+            totals[3] += record.get('payload_bytes', 0)
+        log.info(json.dumps({'event': 'stage', 'session': self.session, **record}))
+
+    def cache_event(self, name, hit):
+        self.cache_events.append((name, hit))
+        with _totals_lock:
+            _cache_totals.setdefault(name, [0, 0])[0 if hit else 1] += 1
+        log.info(json.dumps({'event': 'cache', 'session': self.session, 'cache': name, 'hit': hit}))
+
+    # st.plotly_chart with its payload size, time since the previous stage
+    # (page computation and figure construction) and the time to send the chart
+    def plotly_chart(self, plotly_chart, fig, *args, **kwargs):
+        build_seconds = time.perf_counter() - self._mark
+        payload = len(fig.to_json())
+        frame = self.start('chart', **self._page_fields())
+        result = plotly_chart(fig, *args, **kwargs)
+        self.stop(frame, build_seconds=build_seconds, payload_bytes=payload)
+        return result
+
+    def _page_fields(self):
+        pages = [f.fields['page'] for f in self._stack if 'page' in f.fields]
+        return {'page': pages[-1]} if pages else {}
+
+    # Close the run: sidebar panel, totals and metrics file
+    def finish(self, st):
+        total = self.stop(self._run)
+        with st.sidebar.expander("Performance", expanded=False):
+            rows = [{'stage': r['stage'], 'page': r.get('page', ''), 'ms': round(r['seconds'] * 1000, 1),
+                     'build ms': round(r['build_seconds'] * 1000, 1) if 'build_seconds' in r else None,
+                     'alloc MB': round(r['alloc_peak_bytes'] / 2 ** 20, 2),
+                     'payload KB': round(r['payload_bytes'] / 1024, 1) if 'payload_bytes' in r else None}
+                    for r in self.records]
+            st.dataframe(rows, hide_index=True)
+            st.caption(f"Run {total['seconds'] * 1000:.0f} ms, "
+                       f"traced memory {tracemalloc.get_traced_memory()[0] / 2 ** 20:.0f} MB")
+            with _totals_lock:
+                caches = [{'cache': name, 'hits': hits, 'misses': misses,
+                           'this run': ', '.join('hit' if hit else 'miss' for n, hit in self.cache_events if n == name)}
+                          for name, (hits, misses) in sorted(_cache_totals.items())]
+            st.dataframe(caches, hide_index=True)
+            for name, stats in _provider_stats().items():
+                st.caption(f"{name}: " + ', '.join(f"{key} {value}" for key, value in stats.items()))
+        if METRICS_PATH:
+            write_metrics(METRICS_PATH)
+
+
+class _NullProfiler:
+    def start(self, name, **fields):
+        return None
+
+    def stop(self, frame, **fields):
+        return None
+
+    def stage(self, name, **fields):
+        return contextlib.nullcontext()
+
+    def cache_event(self, name, hit):
+        pass
+
+    def finish(self, st):
+        pass
+
+
+_NULL = _NullProfiler()
+
+
+# Profiler for one rerun; sessions are told apart by an id kept in their session state
+def start_run(session_state):
+    if not ENABLED:
+        return _NULL
+    return Profiler(session_state.setdefault('_profile_session', os.urandom(4).hex()))
+
+
+def current():
+    return getattr(_local, 'profiler', _NULL) if ENABLED else _NULL
+
+
+# Wrap a Streamlit cache decorator (st.cache_data / st.cache_resource) so hits
+# and misses are counted: the inner function only runs on a miss. Like the
+# Streamlit decorators it also takes options, e.g. @cached(max_entries=8).
+def cached(cache):
+    if not ENABLED:
+        return cache
+
+    def decorate(func=None, **options):
+        if func is None:
+            return lambda func: decorate(func, **options)
+        misses = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            misses.count = getattr(misses, 'count', 0) + 1
+            return func(*args, **kwargs)
+
+        cached_func = cache(compute, **options)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            before = getattr(misses, 'count', 0)
+            result = cached_func(*args, **kwargs)
+            current().cache_event(func.__name__, hit=getattr(misses, 'count', 0) == before)
+            return result
+
+        call.clear = cached_func.clear
+        return call
+    return decorate
+
+
+def register_stats(name, stats):
+    _stats_providers[name] = stats
+
+
+def _provider_stats():
+    return {name: stats() for name, stats in sorted(_stats_providers.items())}
+
+
+# st.plotly_chart, instrumented when profiling is enabled
+def chart(plotly_chart):
+    if not ENABLED:
+        return plotly_chart
+    return lambda fig, *args, **kwargs: current().plotly_chart(plotly_chart, fig, *args, **kwargs)
+
+
+def write_metrics(path):
+    with _totals_lock:
+        stages = dict(_stage_totals)
+        caches = dict(_cache_totals)
+    lines = []
+    for metric, index in [('stage_calls_total', 0), ('stage_seconds_total', 1), ('stage_seconds_max', 2),
+                          ('chart_payload_bytes_total', 3)]:
+        lines.append(f'# TYPE dashboard_{metric} {"gauge" if metric.endswith("max") else "counter"}')
+        lines += [f'dashboard_{metric}{{stage="{name}"}} {values[index]}' for name, values in sorted(stages.items())]
+    for metric, index in [('cache_hits_total', 0), ('cache_misses_total', 1)]:
+        lines.append(f'# TYPE dashboard_{metric} counter')
+        lines += [f'dashboard_{metric}{{cache="{name}"}} {values[index]}' for name, values in sorted(caches.items())]
+    for name, stats in _provider_stats().items():
+        for key, value in stats.items():
+            kind = 'counter' if key in ('hits', 'misses', 'evictions', 'completed', 'failed') else 'gauge'
+            metric = f'dashboard_{name}_{key}' + ('_total' if kind == 'counter' else '')
+            lines += [f'# TYPE {metric} {kind}', f'{metric} {value}']
+    lines.append('# TYPE dashboard_traced_memory_bytes gauge')
+    lines.append(f'dashboard_traced_memory_bytes {tracemalloc.get_traced_memory()[0]}')
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
@@ -0,0 +1,113 @@
+# Lagged cross-correlation between the columns of station time series
+#
+# lagged_correlation() gives, for every pair of columns (x, y) and every lag k
+# within ±max_lag hours, the Pearson correlation of x at hour t with y at hour
+# t + k, for a stations x columns x hours array at once. Missing values are
+# masked out rather than filled: each coefficient is built from the pair count,
+# sums, sums of squares and cross products over the hours where both x(t) and
+# y(t + k) exist, so gaps neither count as values nor shift the series. Those
+# sums are cross-correlations of the masked series and their masks, computed
+# with real FFTs in O(n log n) per pair; the series are zero-padded by max_lag
+# only (to a length with small prime factors), since longer lags are not
+# needed. hourly_grid() puts each station's rows (Dataset.rows() returns them
+# sorted by time) on a shared gap-free hourly grid, and station_correlations()
+# keeps the results per (station, station version, columns, max_lag, years) in
+# the process-wide artifact cache.
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import fft
+
+import artifacts
+from aggregates import MEASUREMENT_COLUMNS
+
+MAX_LAG = 72
+# Coefficients over fewer overlapping hours are left missing
+MIN_PAIRS = 24
+
+
+# Values per station and column on a shared gap-free hourly grid, NaN where missing
+def hourly_grid(dataset, stations, columns, years=None):
+    hour = np.timedelta64(1, 'h')
+    rows = [dataset.rows([station], ['date'] + list(columns), years=years) for station in stations]
+    dates = [r['date'].to_numpy() for r in rows]
+    spans = [(d[0], d[-1]) for d in dates if len(d)]
+    if not spans:
+        return np.full((len(stations), len(columns), 0), np.nan)
+    first = min(start for start, _ in spans)
+    grid = np.full((len(stations), len(columns), (max(end for _, end in spans) - first) // hour + 1), np.nan)
+    for i, (station_rows, station_dates) in enumerate(zip(rows, dates)):
+        grid[i][:, (station_dates - first) // hour] = station_rows[list(columns)].to_numpy(dtype='float64').T
+    return grid
+
+
+# Correlation of column i at t with column j at t + lag: (lags, correlations
+# stations x columns x columns x lags, overlapping pair counts of the same shape)
+def lagged_correlation(values, max_lag=MAX_LAG, min_pairs=MIN_PAIRS):
+    n_stations, n_columns, length = values.shape
+    lags = np.arange(-max_lag, max_lag + 1)
+    valid = ~np.isnan(values)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # columns without values
+        means = np.nan_to_num(np.nanmean(values, axis=2, keepdims=True))
+    # Centred values keep the sums small, so the differences of products below
+    # lose no precision; the coefficients do not depend on the shift
+    x = np.where(valid, values - means, 0.0)
+    size = fft.next_fast_len(max(length, max_lag + 1) + max_lag, real=True)
+    spectra = {name: fft.rfft(a, size) for name, a in
+               (('x', x), ('mask', valid.astype('float64')), ('squares', x * x))}
+
+    correlations = np.full((n_stations, n_columns, n_columns, len(lags)), np.nan)
+    pairs = np.zeros(correlations.shape, dtype='int64')
+    for i in range(n_columns):
+        # sum over t of a_i(t) * b_j(t + lag), for the columns j >= i
+        def xcorr(a, b):
+            return fft.irfft(np.conj(spectra[a][:, i:i + 1]) * spectra[b][:, i:], size)[..., lags]
+        count = np.rint(xcorr('mask', 'mask'))
+        sum_x, sum_y = xcorr('x', 'mask'), xcorr('mask', 'x')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (count * xcorr('squares', 'mask') - sum_x ** 2) * (count * xcorr('mask', 'squares') - sum_y ** 2)
+            r = (count * xcorr('x', 'x') - sum_x * sum_y) / np.sqrt(variance)
+        r[(count < min_pairs) | ~(variance > 0)] = np.nan
+        r = np.clip(r, -1, 1)
+        correlations[:, i, i:], pairs[:, i, i:] = r, count
+        # corr(x_j(t), x_i(t + lag)) = corr(x_i(t), x_j(t - lag))
+        correlations[:, i:, i], pairs[:, i:, i] = r[..., ::-1], count[..., ::-1]
+    return lags, correlations, pairs
+
+
+# {station: {'columns', 'lags', 'correlation', 'pairs'}} over the whole record of each
+# station, or the given years (see lagged_correlation). Stations missing from the cache are
+# computed together, `batch` at a time to bound the memory of the spectra.
+def station_correlations(dataset, stations, columns=None, max_lag=MAX_LAG, batch=4, cache=None, years=None):
+    cache = artifacts.CACHE if cache is None else cache
+    columns = [c for c in MEASUREMENT_COLUMNS if c in dataset.columns] if columns is None else list(columns)
+    years = tuple(years) if years is not None else None
+    key = lambda s: ('lagged_correlation', s, dataset.station_versions.get(s), tuple(columns), max_lag, years)
+    results = {s: cache.lookup(key(s)) for s in stations}
+    missing = [s for s in stations if results[s] is None]
+    for start in range(0, len(missing), batch):
+        group = missing[start:start + batch]
+        lags, correlations, pairs = lagged_correlation(hourly_grid(dataset, group, columns, years), max_lag)
+        for i, station in enumerate(group):
+            results[station] = cache.put(key(station), {'columns': columns, 'lags': lags,
+                                                        'correlation': correlations[i], 'pairs': pairs[i]})
+    return results
+
+
+# Per column: the lag of the strongest correlation with `target` following it by that
+# many hours, the correlation there and at lag 0 (the target itself excluded)
+def peak_lags(result, target):
+    columns, lags = result['columns'], result['lags']
+    curves = result['correlation'][:, columns.index(target)]
+    rows = []
+    for column, curve in zip(columns, curves):
+        if column == target:
+            continue
+        peak = np.nanargmax(np.abs(curve)) if not np.isnan(curve).all() else None
+        rows.append({'column': column,
+                     'peak_lag': lags[peak] if peak is not None else np.nan,
+                     'peak_correlation': curve[peak] if peak is not None else np.nan,
+                     'zero_lag_correlation': curve[len(lags) // 2]})
+    return pd.DataFrame(rows).set_index('column')
@@ -0,0 +1,22 @@
+# Per-station work spread over a pool of workers
+#
+# Station partitions are independent, so preprocessing, aggregation, daily
+# resampling and decomposition can run on all cores. Processes are used for
+# CPU-bound pandas work; threads suit NumPy-heavy work that releases the GIL.
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def worker_count(tasks, workers=None):
+    return max(1, min(tasks, workers or os.cpu_count() or 1))
+
+
+# Apply func to every value of {station: item}; returns {station: result}
+def map_stations(func, items, workers=None, threads=False):
+    stations = list(items)
+    workers = worker_count(len(stations), workers)
+    if workers == 1:
+        return {station: func(items[station]) for station in stations}
+    executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with executor(max_workers=workers) as pool:
+        return dict(zip(stations, pool.map(func, [items[s] for s in stations])))
@@ -0,0 +1,87 @@
+# Background precomputation of page artifacts
+#
+# While a visitor reads one page, the artifacts the other pages need for the
+# same selection are computed on a small pool of worker threads. Tasks call the
+# same artifact-cache functions as the pages (artifacts.shared), so a page
+# either finds the completed result or waits on the computation in progress
+# (ArtifactCache.get), and nothing is computed twice, whichever session asked
+# first. Threads rather than processes, because the results must land in this
+# process's cache; the heavy steps are NumPy and Arrow work that releases the
+# GIL.
+#
+# Pending tasks run in order of how often their page has been visited in this
+# process (across sessions), then in the order they were scheduled. A task is
+# not queued again while one with the same key is queued or running, nor once
+# one has completed (a failed task may be queued again). The completed keys are
+# forgotten whenever the artifact cache evicts entries, since the evicted ones
+# may be results of those tasks; this also bounds how many are remembered.
+import itertools
+import threading
+from collections import Counter
+
+import artifacts
+
+
+class Scheduler:
+    def __init__(self, workers=1, cache=None):
+        self.workers = workers
+        self.cache = artifacts.CACHE if cache is None else cache
+        self.visits = Counter()
+        self.completed = 0
+        self.failed = 0
+        self._queue = []  # (page, sequence, key, func)
+        self._keys = set()  # keys of the tasks queued or running
+        self._done = set()  # keys of the completed tasks
+        self._evictions = self.cache.evictions  # cache evictions when _done was last cleared
+        self._threads = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    # Count a visit to a page, raising the priority of its tasks
+    def visit(self, page):
+        with self._lock:
+            self.visits[page] += 1
+
+    # Queue func() for a page unless a task with the same key is pending or done
+    def schedule(self, page, key, func):
+        if self.workers < 1:
+            return
+        with self._lock:
+            if self.cache.evictions != self._evictions:
+                self._done.clear()
+                self._evictions = self.cache.evictions
+            if key in self._keys or key in self._done:
+                return
+            self._keys.add(key)
+            self._queue.append((page, next(self._sequence), key, func))
+            if self._threads < self.workers:
+                self._threads += 1
+                threading.Thread(target=self._work, name='precompute', daemon=True).start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._threads -= 1
+                    return
+                task = min(self._queue, key=lambda t: (-self.visits[t[0]], t[1]))
+                self._queue.remove(task)
+            page, _, key, func = task
+            try:
+                func()
+            except Exception:
+                # The page raises the error itself when it computes the artifact
+                failed = True
+            else:
+                failed = False
+            with self._lock:
+                self._keys.discard(key)
+                if not failed:
+                    self._done.add(key)
+                self.completed += not failed
+                self.failed += failed
+
+    def stats(self):
+        with self._lock:
+            return {'queued': len(self._queue), 'running': len(self._keys) - len(self._queue),
+                    'completed': self.completed, 'failed': self.failed}
@@ -0,0 +1,104 @@
+# Preprocessing of the hourly frame shared by every dashboard page
+#
+# Derived time columns are stored as integer codes / categoricals instead
+# of per-row strings, and the rows are kept grouped by station and sorted by
+# date so a station's data is a contiguous range of one frame rather than a
+# separate copy.
+import numpy as np
+import pandas as pd
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+
+# Add the derived time columns without mutating the input frame
+def add_time_columns(df):
+    df = df.copy(deep=False)
+    # Create datetime column
+    if 'date' not in df.columns:
+        df['date'] = pd.to_datetime(df[['year', 'month', 'day', 'hour']])
+
+    # Extract time components as compact codes
+    dates = df['date'].dt
+    df['day_of_week'] = pd.Categorical.from_codes(dates.dayofweek.to_numpy(), DAY_NAMES)
+    df['hour_of_day'] = dates.hour.to_numpy().astype('int8')
+    df['month_name'] = pd.Categorical.from_codes(dates.month.to_numpy() - 1, MONTH_NAMES)
+    month_index = dates.year.to_numpy() * 12 + dates.month.to_numpy() - 1
+    first, last = (month_index.min(), month_index.max()) if len(df) else (0, -1)
+    labels = [f'{month // 12}-{month % 12 + 1:02d}' for month in range(first, last + 1)]
+    df['year_month'] = pd.Categorical.from_codes(month_index - first, labels)
+    return df
+
+
+# Group rows by station (in order of first appearance) and sort each group by date.
+# Returns the frame and {station: (start, stop)} row ranges.
+def sort_by_station(df):
+    stations = df['station'].astype('category')
+    codes = stations.cat.codes.to_numpy()
+    dates = df['date'].to_numpy()
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    breaks = np.zeros(len(df), dtype=bool)
+    breaks[starts] = True
+    contiguous = len(np.unique(codes[starts])) == len(starts)
+    in_order = bool(np.all((dates[1:] >= dates[:-1]) | breaks[1:]))
+    if not (contiguous and in_order):
+        first_seen = np.full(len(stations.cat.categories), len(df))
+        np.minimum.at(first_seen, codes, np.arange(len(df)))
+        order = np.lexsort((dates, first_seen[codes]))
+        df = df.take(order).reset_index(drop=True)
+        codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+    stops = np.r_[starts[1:], len(df)]
+    labels = df['station'].to_numpy()[starts] if len(df) else []
+    ranges = {label: (int(start), int(stop)) for label, start, stop in zip(labels, starts, stops)}
+    return df, ranges
+
+
+# Rows of a date-sorted frame with start <= date < stop, found by binary search (no copy)
+def date_slice(df, start=None, stop=None):
+    dates = df['date'].to_numpy()
+    first = 0 if start is None else np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), side='left')
+    last = len(df) if stop is None else np.searchsorted(dates, pd.Timestamp(stop).to_datetime64(), side='left')
+    return df.iloc[first:last]
+
+
+def preprocess(df):
+    return sort_by_station(add_time_columns(df))
+
+
+# Rows of one station as a slice of the sorted frame (no copy)
+def station_slice(df, ranges, station):
+    start, stop = ranges.get(station, (0, 0))
+    return df.iloc[start:stop]
+
+
+# Concatenate frames, giving categorical columns the union of all categories
+# (pd.concat would otherwise fall back to object dtype)
+def concat_frames(frames):
+    frames = [df.copy(deep=False) for df in frames]
+    for column in frames[0].columns:
+        if not all(isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames if column in df):
+            continue
+        categories = frames[0][column].cat.categories
+        for df in frames[1:]:
+            categories = categories.union(df[column].cat.categories, sort=False)
+        for df in frames:
+            if not categories.equals(df[column].cat.categories):
+                df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+# Add preprocessed rows newer than each station's existing rows, keeping stations contiguous.
+# Returns the new frame and station ranges.
+def append_rows(df, ranges, batch):
+    batch, batch_ranges = sort_by_station(batch)
+    pieces = []
+    for station in list(ranges) + [s for s in batch_ranges if s not in ranges]:
+        if station in ranges:
+            pieces.append(station_slice(df, ranges, station))
+        if station in batch_ranges:
+            pieces.append(station_slice(batch, batch_ranges, station))
+    return sort_by_station(concat_frames(pieces))
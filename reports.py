@@ -0,0 +1,228 @@
+# Static reports of the dashboard pages, rendered without a Streamlit server
+#
+# Usage:
+#   python reports.py data.store --stations Dongsi Wanliu --periods all 2014 2015-2016
+#                     [--all-stations] [--together] [--formats html csv png]
+#                     [--output reports] [--workers N]
+#
+# One report is rendered per (station, period), or per period for all the
+# listed stations together with --together. A period is "all", a year or a
+# range of years. Each report directory holds report.html (every figure and
+# table of the pages, the Pollution Episodes page with the default pollutant,
+# window and limit, and the lagged correlations of each station with PM10),
+# a CSV per table and, with png in --formats, a PNG per
+# figure (needs the kaleido package). Reports are rendered in parallel on a
+# process pool; the throughput is printed as reports per minute.
+import argparse
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import analytics
+import exposure
+import figures
+import lagcorr
+from ingest import Dataset
+from parallel import worker_count
+
+# Dataset (out of core: aggregates in memory, rows read per report) and decomposer
+# of this process; workers inherit the parent's when forked
+_dataset = None
+_decomposer = None
+
+
+def _init_worker(store):
+    global _dataset
+    if _dataset is None:
+        _dataset = Dataset(store, workers=1, in_memory=False)
+
+
+# "all" -> None, "2014" -> [2014], "2014-2016" -> [2014, 2015, 2016]
+def parse_period(text):
+    if text == 'all':
+        return None
+    first, _, last = text.partition('-')
+    return list(range(int(first), int(last or first) + 1))
+
+
+def _slug(stations, period):
+    name = '-'.join(stations) if len(stations) <= 3 else f'{len(stations)}-stations'
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', f'{name}_{period}')
+
+
+# Figures and tables of every page for the stations over the years
+def build_report(dataset, stations, years, colors):
+    global _decomposer
+    hourly_cube, moments = dataset.hourly_cube, dataset.moments
+    rows = analytics.period_rows(dataset, stations, years, ['year', 'station'] + analytics.CORRELATION_FEATURES)
+    figs, tables = {}, {}
+
+    counts = analytics.record_counts(hourly_cube, stations, years)
+    tables['record_counts_by_station'] = counts['station'].to_frame()
+    figs['records_by_station'] = figures.station_pie(counts['station'])
+    figs['records_by_year'] = figures.count_bar(counts['year'], 'Year', "Records by Year")
+    figs['records_by_month'] = figures.count_bar(counts['month'], 'Month', "Records by Month")
+
+    profile = analytics.hourly_profile(hourly_cube, stations, years=years)
+    tables['hourly_profile'] = profile
+    figs['hourly_profile'] = figures.hourly_profile(profile, colors, 'Daily Pattern of PM10')
+
+    correlation = analytics.correlation_matrix(moments, stations, years=years)
+    tables['correlation'] = correlation
+    figs['correlation'] = figures.correlation_heatmap(correlation, 'Correlation Between PM10 and Meteorological Factors')
+    fits = {}
+    for factor in analytics.METEO_FACTORS:
+        fit = analytics.linear_fit(moments, stations, factor, years=years)
+        fits[factor] = dict(zip(['slope', 'intercept', 'n'], fit))
+        counts_2d, x_edges, y_edges = analytics.scatter_density(dataset, factor, stations, years=years)
+        figs[f'scatter_{factor}'] = figures.scatter_density(counts_2d, x_edges, y_edges, fit, factor, colors)
+    tables['trendlines'] = pd.DataFrame(fits).T
+
+    yearly = analytics.yearly_means(hourly_cube, stations, years=years)
+    monthly = analytics.monthly_means(hourly_cube, stations, years=years)
+    tables['yearly_means'], tables['monthly_means'] = yearly, monthly
+    figs['yearly_means'] = figures.trend_lines(yearly, 'year', colors, 'Yearly Average PM10', 'Year',
+                                               tick0=yearly['year'].min())
+    for year in sorted(monthly['year'].unique()):
+        figs[f'monthly_means_{year}'] = figures.trend_lines(monthly[monthly['year'] == year], 'month', colors,
+                                                            f'Monthly Average PM10 in {year}', 'Month', tick0=1)
+    tables['yearly_stats'] = analytics.yearly_stats(hourly_cube, analytics.yearly_medians(rows), stations, years=years)
+
+    edges, station_counts = analytics.histogram(rows, 'PM10')
+    station_means = analytics.station_means(hourly_cube, stations, years=years)
+    figs['pm10_distribution'] = figures.histogram(edges, station_counts, 'Distribution of PM10 Concentrations by Station',
+                                                  'PM10 Concentration', colors, stations, station_means=station_means)
+    for factor in analytics.METEO_FACTORS:
+        edges, station_counts = analytics.histogram(rows, factor)
+        figs[f'{factor}_distribution'] = figures.histogram(edges, station_counts, f'Distribution of {factor} by Station',
+                                                           factor, colors, stations)
+    figs['pm10_boxes'] = figures.box_plots(analytics.box_stats(dataset, stations, years=years), colors)
+
+    daily = {s: analytics.daily_series(dataset.daily_cube, s, years=years) for s in stations}
+    figs['daily_means'] = figures.daily_lines(daily, colors)
+    if _decomposer is None:
+        from decomposition import Decomposer
+        _decomposer = Decomposer(dataset)
+    label = 'Yearly cycle (365 d)'
+    decompositions = _decomposer.decompose(stations, label)
+    if years is not None:
+        decompositions = {s: d[d['date'].dt.year.isin(years).to_numpy()] for s, d in decompositions.items()}
+    if decompositions:
+        figs['decomposition'] = figures.decomposition(decompositions, colors, f'PM10 Decomposition ({label})')
+
+    # Lagged correlations with PM10 of each station over the period
+    for station, result in lagcorr.station_correlations(dataset, stations, years=years).items():
+        columns, target = result['columns'], 'PM10'
+        figs[f'lag_heatmap_{station}'] = figures.lag_heatmap(
+            result['lags'], columns, result['correlation'][:, columns.index(target)], target,
+            f'{station} Station: Lagged Correlation with {target}')
+        curves = {f: result['correlation'][columns.index(f), columns.index(target)]
+                  for f in analytics.METEO_FACTORS if f in columns}
+        figs[f'lag_curves_{station}'] = figures.lag_curves(result['lags'], curves, target,
+                                                           f'{station} Station: {target} Correlation by Lag')
+        tables[f'peak_lags_{station}'] = lagcorr.peak_lags(result, target)
+
+    # 24-hour PM10 episodes above the national limit, by the year they start in
+    window_label, pollutant = '24-hour', 'PM10'
+    window = exposure.WINDOWS[window_label]
+    limit = exposure.default_limit(pollutant, window)
+    episodes = exposure.station_episodes(dataset, stations, pollutant, window, limit)
+    if years is not None:
+        episodes = episodes[episodes['start'].dt.year.isin(years)]
+    tables['episode_summary'] = exposure.episode_summary(episodes, stations)
+    if not episodes.empty:
+        figs['episode_counts'] = figures.episode_counts(exposure.yearly_episode_counts(episodes), colors,
+                                                        f'{window_label} {pollutant} Episodes per Year')
+        figs['episode_timeline'] = figures.episode_timeline(episodes, colors,
+                                                            f'{window_label} {pollutant} Episode Durations',
+                                                            f'Peak {window_label} mean')
+        tables['longest_episodes'] = episodes.nlargest(10, 'duration').reset_index(drop=True)
+    return figs, tables
+
+
+def write_report(directory, title, figs, tables, formats):
+    os.makedirs(directory, exist_ok=True)
+    if 'csv' in formats:
+        for name, table in tables.items():
+            table.to_csv(os.path.join(directory, f'{name}.csv'))
+    if 'png' in formats:
+        for name, fig in figs.items():
+            fig.write_image(os.path.join(directory, f'{name}.png'))
+    if 'html' in formats:
+        parts = [f'<h1>{title}</h1>']
+        for i, fig in enumerate(figs.values()):
+            parts.append(fig.to_html(full_html=False, include_plotlyjs='cdn' if i == 0 else False))
+        for name, table in tables.items():
+            parts.append(f'<h2>{name.replace("_", " ").capitalize()}</h2>{table.to_html()}')
+        with open(os.path.join(directory, 'report.html'), 'w', encoding='utf-8') as f:
+            f.write(f'<html><head><meta charset="utf-8"><title>{title}</title></head><body>{"".join(parts)}</body></html>')
+
+
+# Render one report (runs in a worker process); returns (directory, seconds)
+def render_report(job):
+    stations, period, output, formats, colors = job
+    start = time.perf_counter()
+    figs, tables = build_report(_dataset, list(stations), parse_period(period), colors)
+    directory = os.path.join(output, _slug(stations, period))
+    write_report(directory, f"{', '.join(stations)}: {period}", figs, tables, formats)
+    return directory, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', help='store directory, e.g. data.store')
+    parser.add_argument('--stations', nargs='*', default=[])
+    parser.add_argument('--all-stations', action='store_true', help='report on every station in the store')
+    parser.add_argument('--periods', nargs='+', default=['all'], help='"all", a year (2014) or a range (2014-2016)')
+    parser.add_argument('--together', action='store_true', help='one report per period covering all the stations')
+    parser.add_argument('--formats', nargs='+', default=['html', 'csv'], choices=['html', 'png', 'csv'])
+    parser.add_argument('--output', default='reports')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    args = parser.parse_args()
+    if 'png' in args.formats:
+        try:
+            import kaleido
+        except ImportError:
+            parser.error("png output needs the kaleido package (pip install kaleido)")
+
+    global _dataset
+    start = time.perf_counter()
+    _dataset = Dataset(args.store, workers=args.workers, in_memory=False)
+    load_seconds = time.perf_counter() - start
+    stations = _dataset.stations if args.all_stations else args.stations
+    unknown = [s for s in stations if s not in _dataset.stations]
+    if not stations or unknown:
+        parser.error(f"unknown stations: {', '.join(unknown)}" if unknown else "no stations given")
+    colors = figures.station_colors(_dataset.stations)
+    groups = [tuple(stations)] if args.together else [(s,) for s in stations]
+    # Every report needs records of its stations in its period
+    for period in args.periods:
+        try:
+            years = parse_period(period)
+        except ValueError:
+            parser.error(f"invalid period {period!r}: use all, a year (2014) or a range (2014-2016)")
+        for group in groups:
+            recorded = _dataset.hourly_cube.count(['year'], station=list(group)).index
+            if years is not None and not set(years) & set(recorded):
+                parser.error(f"no records of {', '.join(group)} in {period} "
+                             f"(years with records: {min(recorded)}-{max(recorded)})")
+    jobs = [(group, period, args.output, args.formats, colors) for group in groups for period in args.periods]
+
+    # Forked workers share the parent's dataset; otherwise each opens the store
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=worker_count(len(jobs), args.workers), mp_context=context,
+                             initializer=_init_worker, initargs=(args.store,)) as pool:
+        for directory, seconds in pool.map(render_report, jobs):
+            print(f"{directory}: {seconds:.2f} s")
+    elapsed = time.perf_counter() - start
+    print(f"{len(jobs)} reports in {elapsed:.1f} s ({len(jobs) / elapsed * 60:.1f} reports per minute), "
+          f"dataset loaded in {load_seconds:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
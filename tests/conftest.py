@@ -0,0 +1,28 @@
+# The modules live at the repository root
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Hourly records of one station in the layout of data.csv
+def hourly_records(station, start, hours, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=hours, freq='h')
+    values = {column: rng.gamma(2.0, 40.0, hours) for column in ['PM2.5', 'PM10', 'SO2', 'NO2', 'CO', 'O3']}
+    values.update(TEMP=rng.normal(12, 10, hours), PRES=rng.normal(1012, 8, hours), DEWP=rng.normal(2, 12, hours),
+                  RAIN=rng.exponential(0.1, hours), WSPM=rng.gamma(2.0, 1.0, hours))
+    frame = pd.DataFrame({'No': np.arange(1, hours + 1), 'year': dates.year, 'month': dates.month,
+                          'day': dates.day, 'hour': dates.hour, **values,
+                          'wd': rng.choice(['N', 'E', 'S', 'W'], hours), 'station': station})
+    frame.loc[rng.random(hours) < 0.05, 'PM10'] = np.nan
+    return frame
+
+
+@pytest.fixture
+def records():
+    return hourly_records
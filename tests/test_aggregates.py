@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import Moments, QuantileSketch
+
+COLUMNS = ['PM10', 'TEMP', 'DEWP', 'PRES']
+
+
+def sample(n, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.multivariate_normal([100, 12, 2, 1012], np.diag([900, 100, 144, 64]) + 20, n)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    return values
+
+
+def test_moments_correlation_matches_pandas():
+    values = sample(2000)
+    expected = pd.DataFrame(values, columns=COLUMNS).corr()
+    np.testing.assert_allclose(Moments.from_array(COLUMNS, values).correlation(), expected, rtol=1e-12)
+
+
+def test_merged_moments_match_the_concatenation():
+    a, b = sample(500, seed=1), sample(700, seed=2) + 50
+    merged = Moments.from_array(COLUMNS, a).merge(Moments.from_array(COLUMNS, b))
+    whole = Moments.from_array(COLUMNS, np.vstack([a, b]))
+    for field in ['n', 'mean', 'comoment', 'sqdev']:
+        np.testing.assert_allclose(getattr(merged, field), getattr(whole, field), rtol=1e-10)
+
+
+def test_linear_fit_matches_least_squares():
+    values = sample(1000)
+    paired = ~np.isnan(values[:, 0]) & ~np.isnan(values[:, 1])
+    slope, intercept, n = Moments.from_array(COLUMNS, values).linear_fit('TEMP', 'PM10')
+    np.testing.assert_allclose([slope, intercept], np.polyfit(values[paired, 1], values[paired, 0], 1), rtol=1e-10)
+    assert n == paired.sum()
+
+
+@pytest.mark.parametrize('accuracy', [0.01, 0.05])
+def test_sketch_quantiles_within_relative_accuracy(accuracy):
+    values = np.random.default_rng(3).normal(5, 20, 10000)
+    q = np.linspace(0, 1, 21)
+    # The sketch returns the value of rank floor(q * (n - 1)) within the relative accuracy
+    expected = np.quantile(values, q, method='lower')
+    result = QuantileSketch.from_values(values, accuracy).quantile(q)
+    assert np.all(np.abs(result - expected) <= accuracy * np.abs(expected) + 1e-12)
+
+
+def test_merged_sketch_matches_the_concatenation():
+    rng = np.random.default_rng(4)
+    a, b = rng.gamma(2, 40, 3000), rng.normal(0, 10, 2000)
+    merged = QuantileSketch.from_values(a).merge(QuantileSketch.from_values(b))
+    whole = QuantileSketch.from_values(np.concatenate([a, b]))
+    np.testing.assert_array_equal(merged.codes, whole.codes)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    assert (merged.min, merged.max) == (whole.min, whole.max)
@@ -0,0 +1,21 @@
+import pandas as pd
+
+import analytics
+from data_store import compact_dtypes, create_store, read_store
+from ingest import Dataset
+from preprocessing import add_time_columns
+
+
+def test_describe_matches_pandas(tmp_path, records):
+    store = str(tmp_path / 'data.store')
+    create_store(store, compact_dtypes(pd.concat([records('Dongsi', '2013-12-01', 24 * 90),
+                                                  records('Wanliu', '2013-12-15', 24 * 60, seed=1),
+                                                  records('Gucheng', '2014-01-01', 24 * 30, seed=2)],
+                                                 ignore_index=True)))
+    dataset = Dataset(store, workers=1, in_memory=False)
+    rows = add_time_columns(read_store(store, stations=['Dongsi', 'Wanliu'], years=[2014]))
+    numeric = rows.select_dtypes('number').columns
+    expected = rows.astype(dict.fromkeys(numeric, 'float64')).describe()
+
+    result = analytics.describe(dataset, ['Dongsi', 'Wanliu'], years=[2014])
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
@@ -0,0 +1,39 @@
+import contextlib
+import importlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import artifacts
+
+PANDAS_2 = int(pd.__version__.split('.')[0]) < 3
+
+
+# Copy-on-write as the dashboard sets it (always on from pandas 3)
+def copy_on_write():
+    return pd.option_context('mode.copy_on_write', True) if PANDAS_2 else contextlib.nullcontext()
+
+
+def test_hit_returns_the_same_frozen_object():
+    cache = artifacts.ArtifactCache()
+    value = cache.put('key', {'values': np.arange(3.0)})
+    assert cache.lookup('key') is value
+    with pytest.raises(ValueError):
+        value['values'][0] = 1
+
+
+def test_modifying_a_cached_frame_leaves_the_cached_one_unchanged():
+    cache = artifacts.ArtifactCache()
+    with copy_on_write():
+        frame = cache.put('key', pd.DataFrame({'PM10': [1.0, 2.0]}))
+        column = frame['PM10']
+        column.iloc[0] = 99.0
+        assert cache.lookup('key')['PM10'].tolist() == [1.0, 2.0]
+
+
+@pytest.mark.skipif(not PANDAS_2, reason='copy-on-write cannot be switched off from pandas 3')
+def test_import_leaves_pandas_options_alone():
+    with pd.option_context('mode.copy_on_write', False):
+        importlib.reload(artifacts)
+        assert pd.options.mode.copy_on_write is False
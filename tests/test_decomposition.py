@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import artifacts
+from decomposition import Decomposer, classical_decompose
+
+
+# Stand-in for Dataset with the attributes the decomposer reads
+class Rows:
+    def __init__(self, frames):
+        self.frames = frames
+        self.station_versions = {station: 'v1' for station in frames}
+
+    def rows(self, stations, columns):
+        return self.frames[stations[0]][columns]
+
+
+def pm10(start, hours, seed=0, missing=()):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=hours, freq='h')
+    values = 80 + 30 * np.sin(np.arange(hours) * 2 * np.pi / 24) + np.linspace(0, 20, hours) + rng.normal(0, 5, hours)
+    return pd.DataFrame({'date': dates, 'PM10': values}).drop(index=list(missing)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize('period', [24, 168])
+def test_classical_matches_statsmodels(period):
+    from statsmodels.tsa.seasonal import seasonal_decompose
+
+    values = np.stack([pm10('2014-01-01', 24 * 60, seed)['PM10'].to_numpy() for seed in range(3)])
+    parts = classical_decompose(values, period)
+    for row, series in enumerate(values):
+        expected = seasonal_decompose(series, period=period)
+        np.testing.assert_allclose(parts['trend'][row], expected.trend, rtol=1e-10)
+        np.testing.assert_allclose(parts['seasonal'][row], expected.seasonal, rtol=1e-10, atol=1e-10)
+        np.testing.assert_allclose(parts['residual'][row], expected.resid, rtol=1e-10, atol=1e-10)
+
+
+@pytest.mark.parametrize('method', ['classical', 'stl'])
+def test_station_result_does_not_depend_on_the_batch(method):
+    dataset = Rows({'Dongsi': pm10('2014-01-01', 24 * 90), 'Wanliu': pm10('2014-01-20', 24 * 40, 1, range(100, 130))})
+    alone = Decomposer(dataset, cache=artifacts.ArtifactCache()).decompose(['Wanliu'], 'Daily cycle (24 h)', method)
+    batch = Decomposer(dataset, cache=artifacts.ArtifactCache()).decompose(['Dongsi', 'Wanliu'],
+                                                                          'Daily cycle (24 h)', method)
+    pd.testing.assert_frame_equal(alone['Wanliu'], batch['Wanliu'])
+    assert batch['Wanliu']['date'].iloc[-1] <= dataset.frames['Wanliu']['date'].iloc[-1]
+
+
+def test_cached_stations_are_kept_beside_insufficient_ones():
+    dataset = Rows({'Dongsi': pm10('2014-01-01', 24 * 30), 'Wanliu': pm10('2014-01-01', 24 * 10)})
+    decomposer = Decomposer(dataset, cache=artifacts.ArtifactCache())
+    decomposer.decompose(['Dongsi'], 'Weekly cycle (168 h)')
+    assert list(decomposer.decompose(['Dongsi', 'Wanliu'], 'Weekly cycle (168 h)')) == ['Dongsi']
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from exposure import episodes, rolling_means
+
+
+def hourly_series(seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2015-01-01', periods=24 * 30, freq='h')
+    values = rng.gamma(2.0, 50.0, len(dates))
+    values[rng.random(len(dates)) < 0.1] = np.nan
+    # Missing hours as well as missing values
+    keep = np.ones(len(dates), dtype=bool)
+    keep[100:130] = keep[400:405] = False
+    return dates[keep].to_numpy(), values[keep]
+
+
+@pytest.mark.parametrize('window', [24, 8])
+def test_rolling_means_match_pandas(window):
+    dates, values = hourly_series()
+    first, means = rolling_means(dates, values, window)
+    series = pd.Series(values, index=dates).asfreq('h')
+    expected = series.rolling(window, min_periods=int(np.ceil(0.75 * window))).mean()
+    assert first == dates[0]
+    np.testing.assert_allclose(means, expected.to_numpy(), rtol=1e-12)
+
+
+def test_episodes_are_the_runs_above_the_limit():
+    first, means = rolling_means(*hourly_series(seed=1), 24)
+    result = episodes(first, means, 100)
+    # Runs found by walking the hours
+    runs, start = [], None
+    for hour, mean in enumerate(np.append(means, np.nan)):
+        if mean > 100 and start is None:
+            start = hour
+        elif not mean > 100 and start is not None:
+            runs.append((start, hour - start, np.nanmax(means[start:hour])))
+            start = None
+    hour = np.timedelta64(1, 'h')
+    assert list(result['start']) == [first + s * hour for s, _, _ in runs]
+    assert list(result['duration']) == [d for _, d, _ in runs]
+    np.testing.assert_array_equal(result['peak'], [p for _, _, p in runs])
+    assert (result['end'] - result['start'] == (result['duration'] - 1) * hour).all()
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetch as fetch_module
+from fetch import fetch
+
+CONTENT = bytes(range(256)) * 4096
+ETAG = '"v1"'
+
+
+# Serves `content` with the ETag `etag` (none if None), honouring If-None-Match
+# and Range / If-Range
+class Handler(BaseHTTPRequestHandler):
+    requests = []
+    content, etag = CONTENT, ETAG
+
+    def do_HEAD(self):
+        Handler.requests.append(dict(self.headers, method='HEAD'))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(Handler.content)))
+        self.end_headers()
+
+    def do_GET(self):
+        content, etag = Handler.content, Handler.etag
+        headers = dict(self.headers)
+        Handler.requests.append(dict(headers, method='GET'))
+        if etag is not None and headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        if etag is not None and 'Range' in headers and headers.get('If-Range') == etag:
+            start = int(headers['Range'].split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+        else:
+            self.send_response(200)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Handler.requests = []
+    Handler.content, Handler.etag = CONTENT, ETAG
+    yield f'http://127.0.0.1:{server.server_address[1]}/data.csv'
+    server.shutdown()
+    server.server_close()
+
+
+def test_unchanged_upstream_is_not_downloaded_again(tmp_path, url):
+    path = str(tmp_path / 'data.csv')
+    digest = fetch(url, path)
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert fetch(url, path) == digest
+    assert Handler.requests[-1]['If-None-Match'] == ETAG
+    assert open(path, 'rb').read() == CONTENT
+
+
+def test_interrupted_download_resumes(tmp_path, url):
+    path = str(tmp_path / 'data.csv')
+    with open(path + '.part', 'wb') as f:
+        f.write(CONTENT[:1000])
+    with open(path + '.part.meta.json', 'w') as f:
+        json.dump({'source': url, 'etag': ETAG, 'last_modified': None}, f)
+
+    assert fetch(url, path) == hashlib.sha256(CONTENT).hexdigest()
+    assert Handler.requests[-1]['Range'] == 'bytes=1000-'
+    assert open(path, 'rb').read() == CONTENT
+    assert not os.path.exists(path + '.part')
+
+
+def test_digest_mismatch_keeps_no_file(tmp_path, url):
+    path = str(tmp_path / 'data.csv')
+    with pytest.raises(ValueError, match='SHA-256'):
+        fetch(url, path, sha256='0' * 64)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.part')
+
+
+def test_expected_digest_is_compared_case_insensitively(tmp_path, url):
+    path = str(tmp_path / 'data.csv')
+    digest = hashlib.sha256(CONTENT).hexdigest()
+    fetch(url, path, sha256=digest.upper())
+    assert fetch(url, path, sha256=digest.upper()) == digest
+    assert Handler.requests[-1]['If-None-Match'] == ETAG
+
+
+def test_upstream_without_validators_is_checked_again(tmp_path, url, monkeypatch):
+    path = str(tmp_path / 'data.csv')
+    Handler.etag = None
+    fetch(url, path)
+    # Same size: only a HEAD request
+    fetch(url, path)
+    assert [r['method'] for r in Handler.requests] == ['GET', 'HEAD']
+
+    # A different size is downloaded again
+    Handler.content = CONTENT[:-1]
+    assert fetch(url, path) == hashlib.sha256(CONTENT[:-1]).hexdigest()
+    assert open(path, 'rb').read() == CONTENT[:-1]
+
+    # So is a file older than the maximum age, whatever its size
+    monkeypatch.setattr(fetch_module, 'MAX_AGE_SECONDS', 0)
+    Handler.content = CONTENT[1:]
+    assert fetch(url, path) == hashlib.sha256(CONTENT[1:]).hexdigest()
+    assert Handler.requests[-1]['method'] == 'GET'
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+from data_store import compact_dtypes, create_store, read_manifest, read_store
+import ingest
+from aggregates import DAILY_KEYS, HOURLY_KEYS, AggregateCube, partition_moments
+from ingest import Dataset, DateRangeView, append_batch
+from preprocessing import add_time_columns
+
+
+def test_append_deduplicates_on_station_and_time(tmp_path, records):
+    store = str(tmp_path / 'data.store')
+    create_store(store, compact_dtypes(records('Dongsi', '2014-01-01', 48)))
+    new = records('Dongsi', '2014-01-02 12:00', 24, seed=1)
+    repeated = new.iloc[[-1]].assign(PM10=123.0)
+    kept = append_batch(store, pd.concat([new, repeated], ignore_index=True))
+
+    # Hours up to the high-water mark are already stored; within the batch the last row wins
+    assert len(kept) == 12
+    assert kept['PM10'].iloc[-1] == 123.0
+    assert read_manifest(store)['high_water_mark']['Dongsi'] == '2014-01-03T11:00:00'
+    assert len(append_batch(store, new)) == 0
+
+
+def test_incremental_refresh_matches_rebuild(tmp_path, records):
+    history = pd.concat([records('Dongsi', '2014-01-01', 24 * 40), records('Wanliu', '2014-01-01', 24 * 40, seed=1)],
+                        ignore_index=True)
+    batch = records('Dongsi', '2014-02-10', 24 * 30, seed=2)
+    incremental = str(tmp_path / 'incremental.store')
+    create_store(incremental, compact_dtypes(history))
+    datasets = [Dataset(incremental, workers=1, in_memory=in_memory) for in_memory in (True, False)]
+    wanliu = datasets[0].station_versions['Wanliu']
+    append_batch(incremental, batch)
+
+    rebuilt = str(tmp_path / 'rebuilt.store')
+    create_store(rebuilt, compact_dtypes(pd.concat([history, batch], ignore_index=True)))
+    expected = Dataset(rebuilt, workers=1)
+    for dataset in datasets:
+        assert dataset.refresh() == ['Dongsi']
+        assert dataset.station_versions['Wanliu'] == wanliu
+        assert dataset.row_count == expected.row_count
+        for name, frame in expected.hourly_cube.stats.items():
+            pd.testing.assert_frame_equal(dataset.hourly_cube.stats[name], frame, check_index_type=False)
+        assert dataset.moments.keys() == expected.moments.keys()
+        for key, moments in expected.moments.items():
+            np.testing.assert_allclose(dataset.moments[key].comoment, moments.comoment, rtol=1e-9, atol=1e-6)
+        pd.testing.assert_frame_equal(dataset.rows(['Dongsi'], ['date', 'PM10']).reset_index(drop=True),
+                                      expected.rows(['Dongsi'], ['date', 'PM10']).reset_index(drop=True))
+
+
+def test_aggregates_do_not_depend_on_the_year_batches(tmp_path, records, monkeypatch):
+    store = str(tmp_path / 'data.store')
+    create_store(store, compact_dtypes(pd.concat([records('Dongsi', '2013-10-01', 24 * 200),
+                                                  records('Wanliu', '2014-06-01', 24 * 90, seed=1)], ignore_index=True)))
+    whole = Dataset(store, workers=1, in_memory=False)
+    monkeypatch.setattr(ingest, 'BATCH_ROWS', 1)
+    by_year = Dataset(store, workers=1, in_memory=False)
+    for cube in ('hourly_cube', 'daily_cube'):
+        for name, frame in getattr(whole, cube).stats.items():
+            pd.testing.assert_frame_equal(getattr(by_year, cube).stats[name], frame)
+    assert by_year.moments.keys() == whole.moments.keys()
+    for key, moments in whole.moments.items():
+        np.testing.assert_array_equal(by_year.moments[key].comoment, moments.comoment)
+
+
+def test_reopening_reads_only_the_segments_appended_since(tmp_path, records, monkeypatch):
+    store = str(tmp_path / 'data.store')
+    create_store(store, compact_dtypes(pd.concat([records('Dongsi', '2014-01-01', 24 * 40),
+                                                  records('Wanliu', '2014-01-01', 24 * 40, seed=1)], ignore_index=True)))
+    Dataset(store, workers=1, in_memory=False)
+    append_batch(store, records('Dongsi', '2014-02-10', 24 * 30, seed=2))
+
+    read, map_stations = [], ingest.map_stations
+
+    # The segments each station is aggregated from
+    def spy(func, items, **kwargs):
+        read.extend((station, tuple(item[1])) for station, item in items.items())
+        return map_stations(func, items, **kwargs)
+    monkeypatch.setattr(ingest, 'map_stations', spy)
+    reopened = Dataset(store, workers=1, in_memory=False)
+    assert read == [('Dongsi', ('part-00001.arrow',))]
+    assert reopened.station_versions['Wanliu'].endswith('-0')
+
+    rebuilt = str(tmp_path / 'rebuilt.store')
+    create_store(rebuilt, compact_dtypes(read_store(store)))
+    expected = Dataset(rebuilt, workers=1, in_memory=False)
+    assert reopened.row_count == expected.row_count
+    for name, frame in expected.daily_cube.stats.items():
+        pd.testing.assert_frame_equal(reopened.daily_cube.stats[name], frame, check_index_type=False)
+    for key, moments in expected.moments.items():
+        np.testing.assert_allclose(reopened.moments[key].comoment, moments.comoment)
+
+
+def test_date_range_view_matches_the_rows_of_the_range(tmp_path, records, monkeypatch):
+    store = str(tmp_path / 'data.store')
+    create_store(store, compact_dtypes(pd.concat([records('Dongsi', '2013-11-20', 24 * 150),
+                                                  records('Wanliu', '2014-01-10', 24 * 60, seed=1)], ignore_index=True)))
+    dataset = Dataset(store, workers=1, in_memory=False)
+    rows = add_time_columns(read_store(store))
+    read = []
+
+    def spy(*args, **kwargs):
+        read.append(read_store(*args, **kwargs))
+        return read[-1]
+    monkeypatch.setattr(ingest, 'read_store', spy)
+    # Cut months at both ends, whole months only, and a range inside one month
+    for start, stop, months in [('2013-12-17 05:00', '2014-03-02', [(2013, 12), (2014, 3)]),
+                                ('2014-01-01', '2014-03-01', []), ('2014-02-03', '2014-02-04', [(2014, 2)])]:
+        read.clear()
+        view = DateRangeView(dataset, start, stop)
+        # Only the months the range cuts are read
+        assert sorted({(y, m) for frame in read for y, m in zip(frame['year'], frame['month'])}) == months
+        expected = rows[(rows['date'] >= start) & (rows['date'] < stop)]
+        assert view.row_count == len(expected)
+        for cube, keys in [(view.hourly_cube, HOURLY_KEYS), (view.daily_cube, DAILY_KEYS)]:
+            for name, frame in AggregateCube.build(expected, keys).stats.items():
+                pd.testing.assert_frame_equal(cube.stats[name].reset_index().astype({'station': str}),
+                                              frame.reset_index().astype({'station': str}), check_exact=False)
+        moments = partition_moments(expected, workers=1)
+        assert view.moments.keys() == moments.keys()
+        for key, value in moments.items():
+            np.testing.assert_allclose(view.moments[key].comoment, value.comoment)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from lagcorr import lagged_correlation
+
+
+def series(seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(2, 3, 3000)).cumsum(axis=2) + rng.normal(0, 5, (2, 3, 3000))
+    values[:, 1, 7:] += 2 * values[:, 0, :-7]
+    values[rng.random(values.shape) < 0.15] = np.nan
+    values[:, :, 1000:1300] = np.nan
+    return values
+
+
+def test_matches_pearson_over_the_pairs_present():
+    values = series()
+    lags, correlations, pairs = lagged_correlation(values, max_lag=48)
+    for station in range(2):
+        for i in range(3):
+            for j in range(3):
+                for lag in [-48, -7, 0, 7, 31, 48]:
+                    x = values[station, i, :len(values[0, 0]) - lag] if lag >= 0 else values[station, i, -lag:]
+                    y = values[station, j, lag:] if lag >= 0 else values[station, j, :lag]
+                    both = ~np.isnan(x) & ~np.isnan(y)
+                    k = np.searchsorted(lags, lag)
+                    assert pairs[station, i, j, k] == both.sum()
+                    np.testing.assert_allclose(correlations[station, i, j, k],
+                                               np.corrcoef(x[both], y[both])[0, 1], atol=1e-12)
+
+
+def test_a_lagged_copy_peaks_at_its_lag():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=(1, 2, 5000))
+    values[0, 1, 5:] += values[0, 0, :-5]
+    lags, correlations, _ = lagged_correlation(values, max_lag=24)
+    # Column 1 follows column 0 by 5 hours
+    assert lags[np.nanargmax(correlations[0, 0, 1])] == 5
+    np.testing.assert_array_equal(correlations[0, 1, 0], correlations[0, 0, 1][::-1])
+
+
+def test_too_few_pairs_and_constant_columns_are_missing():
+    values = np.full((1, 2, 200), np.nan)
+    values[0, 0, :10] = np.arange(10)
+    values[0, 1] = 3.0
+    _, correlations, _ = lagged_correlation(values, max_lag=5, min_pairs=24)
+    assert np.isnan(correlations).all()
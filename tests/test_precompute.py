@@ -0,0 +1,28 @@
+import time
+
+import artifacts
+import precompute
+
+
+# Schedule a task, wait until nothing is queued or running, and return the tasks completed so far
+def run(scheduler, key, func):
+    scheduler.schedule('Overview', key, func)
+    deadline = time.monotonic() + 5
+    while scheduler.stats()['queued'] + scheduler.stats()['running'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return scheduler.stats()['completed']
+
+
+def test_completed_task_is_not_queued_again():
+    scheduler = precompute.Scheduler(cache=artifacts.ArtifactCache())
+    assert run(scheduler, 'key', lambda: None) == 1
+    assert run(scheduler, 'key', lambda: None) == 1
+
+
+def test_task_is_queued_again_after_an_eviction():
+    cache = artifacts.ArtifactCache(max_bytes=1000)
+    scheduler = precompute.Scheduler(cache=cache)
+    assert run(scheduler, 'key', lambda: cache.put('key', b'x' * 500)) == 1
+    cache.put('other', b'x' * 900)
+    assert cache.lookup('key') is None
+    assert run(scheduler, 'key', lambda: cache.put('key', b'x' * 500)) == 2
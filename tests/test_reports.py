@@ -0,0 +1,24 @@
+import pandas as pd
+
+import figures
+import reports
+from data_store import compact_dtypes, create_store
+from ingest import Dataset
+
+
+def test_report_covers_episodes_and_lagged_correlations(tmp_path, records):
+    store = str(tmp_path / 'data.store')
+    history = pd.concat([records('Dongsi', '2013-11-01', 24 * 120), records('Wanliu', '2013-11-01', 24 * 120, seed=1)],
+                        ignore_index=True)
+    # A week of 24-hour PM10 means far above the limit at Dongsi, starting in 2014
+    history.loc[(history['station'] == 'Dongsi') & (history['year'] == 2014) & (history['month'] == 1)
+                & (history['day'] <= 7), 'PM10'] = 400.0
+    create_store(store, compact_dtypes(history))
+    dataset = Dataset(store, workers=1, in_memory=False)
+    figs, tables = reports.build_report(dataset, ['Dongsi', 'Wanliu'], [2014], figures.station_colors(dataset.stations))
+
+    assert {'lag_heatmap_Dongsi', 'lag_curves_Wanliu', 'episode_counts', 'episode_timeline'} <= set(figs)
+    assert 'TEMP' in tables['peak_lags_Dongsi'].index and 'PM10' not in tables['peak_lags_Dongsi'].index
+    summary = tables['episode_summary']
+    assert summary.loc['Dongsi', 'episodes'] >= 1 and summary.loc['Wanliu', 'episodes'] == 0
+    assert (tables['longest_episodes']['start'].dt.year == 2014).all()